@@ -0,0 +1,6 @@
+# __init__.py
+# Copyright (C) 2012 the ColanderAlchemy authors and contributors
+# <see AUTHORS file>
+#
+# This module is part of ColanderAlchemy and is released under
+# the MIT License: http://www.opensource.org/licenses/mit-license.php
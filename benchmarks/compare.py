@@ -0,0 +1,70 @@
+# compare.py
+# Copyright (C) 2012 the ColanderAlchemy authors and contributors
+# <see AUTHORS file>
+#
+# This module is part of ColanderAlchemy and is released under
+# the MIT License: http://www.opensource.org/licenses/mit-license.php
+
+""" Compare two benchmark result files.
+
+Run with::
+
+    python -m benchmarks.compare before.json after.json
+
+Prints the ratio of every measurement found in both files and exits with a
+non-zero status if any of them regressed by more than the threshold.
+"""
+
+import argparse
+import json
+import sys
+
+
+def _values(path):
+    with open(path) as stream:
+        data = json.load(stream)
+    values = {}
+    for result in data['results']:
+        if result['kind'] == 'time':
+            values[result['name']] = (result['min'], 's')
+        else:
+            values[result['name']] = (result['peak'], 'B')
+    return values
+
+
+def compare(before, after, threshold):
+    regressions = []
+    for name in sorted(set(before) & set(after)):
+        old, unit = before[name]
+        new = after[name][0]
+        ratio = new / old if old else float('inf')
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = 'REGRESSION'
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            flag = 'improvement'
+        print('%-50s %14.6g %14.6g %2s %7.2fx %s'
+              % (name, old, new, unit, ratio, flag))
+    for name in sorted(set(before) ^ set(after)):
+        print('%-50s only in %s' % (name,
+                                    'before' if name in before else 'after'))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip()
+                                     .splitlines()[0])
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('-t', '--threshold', type=float, default=0.1,
+                        help='relative change considered significant '
+                             '(default: 0.1)')
+    args = parser.parse_args(argv)
+    regressions = compare(_values(args.before), _values(args.after),
+                          args.threshold)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,135 @@
+# construction.py
+# Copyright (C) 2012 the ColanderAlchemy authors and contributors
+# <see AUTHORS file>
+#
+# This module is part of ColanderAlchemy and is released under
+# the MIT License: http://www.opensource.org/licenses/mit-license.php
+
+""" Benchmarks of schema construction.
+
+Run with::
+
+    python -m benchmarks.construction --output construction.json
+
+Measures building :class:`SQLAlchemySchemaNode` instances for wide tables,
+large registries, deep relationship chains, diamonds and self-referential
+models, ``setup_schema`` over a whole registry, loading the schemas of a
+registry from a snapshot, cloning and peak memory.
+"""
+
+import os
+import shutil
+import tempfile
+
+from colanderalchemy import (SchemaCache,
+                             SQLAlchemySchemaNode,
+                             setup_lazy_schema,
+                             setup_schema,
+                             warm_all)
+from colanderalchemy.schema import _clear_node_sources
+from colanderalchemy.snapshot import setup_schema_snapshot
+
+from benchmarks import models
+from benchmarks.runner import main
+
+
+def run(runner):
+    quick = runner.quick
+    sizes = dict(
+        columns=100 if quick else 1000,
+        models=50 if quick else 500,
+        depth=10 if quick else 50,
+        layers=3 if quick else 6,
+    )
+
+    Wide = models.wide_model(sizes['columns'])
+    runner.time('construct.wide',
+                lambda: SQLAlchemySchemaNode(Wide),
+                columns=sizes['columns'])
+
+    Base, classes = models.registry(sizes['models'])
+    runner.time('construct.registry',
+                lambda: [SQLAlchemySchemaNode(cls) for cls in classes],
+                models=sizes['models'])
+
+    Head = models.chain(sizes['depth'])
+    runner.time('construct.chain',
+                lambda: SQLAlchemySchemaNode(Head),
+                depth=sizes['depth'])
+
+    Top = models.diamonds(sizes['layers'])
+    runner.time('construct.diamonds',
+                lambda: SQLAlchemySchemaNode(Top),
+                layers=sizes['layers'])
+
+    Node = models.self_referential()
+    runner.time('construct.self_referential',
+                lambda: SQLAlchemySchemaNode(Node))
+
+    def setup_all(setup):
+        for cls in classes:
+            setup(None, cls)
+
+    runner.time('setup_schema.registry',
+                lambda: setup_all(setup_schema),
+                models=sizes['models'])
+    runner.time('setup_schema.registry.lazy',
+                lambda: setup_all(setup_lazy_schema),
+                models=sizes['models'])
+    runner.time('setup_schema.registry.lazy_warm_all',
+                lambda: warm_all(Base),
+                setup=lambda: setup_all(setup_lazy_schema),
+                models=sizes['models'])
+    runner.time('setup_schema.registry.reuse_nodes',
+                lambda: [SQLAlchemySchemaNode(cls, reuse_nodes=True)
+                         for cls in classes],
+                setup=_clear_node_sources,
+                models=sizes['models'])
+
+    # Snapshots pickle the schemas, which refer to the models by name.
+    for cls in classes:
+        setattr(models, cls.__name__, cls)
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'schemas.snapshot')
+        setup_schema_snapshot(Base, path)
+        runner.time('snapshot.registry.load',
+                    lambda: setup_schema_snapshot(Base, path),
+                    models=sizes['models'])
+        runner.time('snapshot.registry.load_warm_all',
+                    lambda: (setup_schema_snapshot(Base, path),
+                             warm_all(Base)),
+                    models=sizes['models'])
+    finally:
+        shutil.rmtree(directory)
+
+    cache = SchemaCache(maxsize=None)
+    cache_get = lambda: [cache.get(cls) for cls in classes]
+    cache_get()
+    runner.time('cache.registry.hit', cache_get, models=sizes['models'])
+
+    wide = SQLAlchemySchemaNode(Wide)
+    runner.time('clone.wide', wide.clone, columns=sizes['columns'])
+    runner.time('bind.wide', lambda: wide.bind(request=None),
+                columns=sizes['columns'])
+    diamond = SQLAlchemySchemaNode(Top)
+    runner.time('clone.diamonds', diamond.clone, layers=sizes['layers'])
+
+    runner.memory('memory.wide',
+                  lambda: SQLAlchemySchemaNode(Wide),
+                  columns=sizes['columns'])
+    runner.memory('memory.registry',
+                  lambda: [SQLAlchemySchemaNode(cls) for cls in classes],
+                  models=sizes['models'])
+    runner.memory('memory.registry.reuse_nodes',
+                  lambda: [SQLAlchemySchemaNode(cls, reuse_nodes=True)
+                           for cls in classes],
+                  setup=_clear_node_sources,
+                  models=sizes['models'])
+    runner.memory('memory.diamonds',
+                  lambda: SQLAlchemySchemaNode(Top),
+                  layers=sizes['layers'])
+
+
+if __name__ == '__main__':
+    main('construction', run, __doc__.strip().splitlines()[0])
@@ -0,0 +1,194 @@
+# models.py
+# Copyright (C) 2012 the ColanderAlchemy authors and contributors
+# <see AUTHORS file>
+#
+# This module is part of ColanderAlchemy and is released under
+# the MIT License: http://www.opensource.org/licenses/mit-license.php
+
+""" Synthetic declarative models and data used by the benchmarks.
+
+Every factory creates its models on a new declarative base, so that they can
+be called several times with different sizes, and configures the mappers
+before returning so that mapper configuration is not part of the
+measurements.
+"""
+
+import datetime
+import decimal
+
+from sqlalchemy import (Boolean,
+                        Column,
+                        Date,
+                        DateTime,
+                        Float,
+                        ForeignKey,
+                        Integer,
+                        Numeric,
+                        Unicode)
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import (configure_mappers,
+                            relationship)
+
+
+COLUMN_TYPES = [
+    lambda: Unicode(64),
+    lambda: Integer(),
+    lambda: Boolean(),
+    lambda: Float(),
+    lambda: Numeric(10, 2),
+    lambda: Date(),
+    lambda: DateTime(),
+]
+
+
+def _value(type_, i):
+    """ Return a value for a column of type ``type_``. """
+    if isinstance(type_, Unicode):
+        return u'value %d' % i
+    elif isinstance(type_, Boolean):
+        return i % 2 == 0
+    elif isinstance(type_, Integer):
+        return i
+    elif isinstance(type_, Float):
+        return i / 4.0
+    elif isinstance(type_, Numeric):
+        return decimal.Decimal(i) / 100
+    elif isinstance(type_, DateTime):
+        return datetime.datetime(2020, 1, 1) + datetime.timedelta(minutes=i)
+    elif isinstance(type_, Date):
+        return datetime.date(2020, 1, 1) + datetime.timedelta(days=i % 1000)
+    raise TypeError(type_)
+
+
+def values(class_, i, nulls=True):
+    """ Return a dict of values for the ``field_*`` columns of ``class_``.
+
+    If ``nulls`` is true, every third nullable column is set to ``None``.
+    """
+    values = {}
+    for column in class_.__table__.columns:
+        if not column.name.startswith('field_'):
+            continue
+        if nulls and column.nullable and i % 3 == 0:
+            values[column.name] = None
+        else:
+            values[column.name] = _value(column.type, i)
+    return values
+
+
+def _columns(count, prefix='field'):
+    """ Return ``count`` columns of assorted types. """
+    columns = {}
+    for i in range(count):
+        type_ = COLUMN_TYPES[i % len(COLUMN_TYPES)]()
+        columns['%s_%d' % (prefix, i)] = Column(type_, nullable=i % 2 == 0)
+    return columns
+
+
+def _model(base, name, attrs):
+    attrs.setdefault('__tablename__', name.lower())
+    attrs.setdefault('id', Column(Integer, primary_key=True))
+    return type(name, (base,), attrs)
+
+
+def wide_model(columns=1000):
+    """ Return a single model with ``columns`` columns. """
+    Base = declarative_base()
+    Wide = _model(Base, 'Wide', _columns(columns))
+    configure_mappers()
+    return Wide
+
+
+def registry(models=500, columns=10, relationships=2, hubs=10):
+    """ Return the base and list of ``models`` models.
+
+    The first ``hubs`` models only have columns; every other model has
+    ``columns`` columns and ``relationships`` many-to-one relationships to
+    hub models, like the ``created_by`` or ``owner`` relationships found in
+    most applications.
+    """
+    Base = declarative_base()
+    classes = []
+    for i in range(models):
+        name = 'Model%d' % i
+        attrs = _columns(columns)
+        if i >= hubs:
+            for j in range(relationships):
+                target = classes[(i + j) % hubs]
+                key = 'rel_%d' % j
+                attrs['%s_id' % key] = Column(
+                    Integer, ForeignKey('%s.id' % target.__tablename__))
+                attrs[key] = relationship(
+                    target, foreign_keys=[attrs['%s_id' % key]])
+        classes.append(_model(Base, name, attrs))
+    configure_mappers()
+    return Base, classes
+
+
+def chain(depth=50, columns=5):
+    """ Return the head of a chain of ``depth`` many-to-one relationships. """
+    Base = declarative_base()
+    previous = None
+    for i in reversed(range(depth)):
+        attrs = _columns(columns)
+        if previous is not None:
+            attrs['next_id'] = Column(
+                Integer, ForeignKey('%s.id' % previous.__tablename__))
+            attrs['next'] = relationship(previous)
+        previous = _model(Base, 'Link%d' % i, attrs)
+    configure_mappers()
+    return previous
+
+
+def diamonds(layers=6, columns=5):
+    """ Return the top of ``layers`` stacked diamonds.
+
+    Each layer has a model with two relationships, to a left and a right
+    model, which both have a relationship to the model of the next layer.
+    """
+    Base = declarative_base()
+    bottom = _model(Base, 'Bottom', _columns(columns))
+    for i in reversed(range(layers)):
+        sides = []
+        for side in ('Left', 'Right'):
+            attrs = _columns(columns)
+            attrs['down_id'] = Column(
+                Integer, ForeignKey('%s.id' % bottom.__tablename__))
+            attrs['down'] = relationship(bottom)
+            sides.append(_model(Base, '%s%d' % (side, i), attrs))
+        attrs = _columns(columns)
+        for side in sides:
+            key = side.__name__.lower()
+            attrs['%s_id' % key] = Column(
+                Integer, ForeignKey('%s.id' % side.__tablename__))
+            attrs[key] = relationship(side,
+                                      foreign_keys=[attrs['%s_id' % key]])
+        bottom = _model(Base, 'Top%d' % i, attrs)
+    configure_mappers()
+    return bottom
+
+
+def self_referential(columns=5):
+    """ Return a tree model with ``parent`` and ``children`` relationships. """
+    Base = declarative_base()
+    attrs = _columns(columns)
+    attrs['parent_id'] = Column(Integer, ForeignKey('node.id'))
+    Node = _model(Base, 'Node', attrs)
+    Node.parent = relationship(Node, remote_side=[Node.id],
+                               backref='children')
+    configure_mappers()
+    return Node
+
+
+def one_to_many(columns=10):
+    """ Return a ``Parent`` model with a ``children`` collection of ``Child``
+    instances, each with a ``parent`` backref.
+    """
+    Base = declarative_base()
+    Parent = _model(Base, 'Parent', _columns(columns))
+    attrs = _columns(columns)
+    attrs['parent_id'] = Column(Integer, ForeignKey('parent.id'))
+    Child = _model(Base, 'Child', attrs)
+    Parent.children = relationship(Child, backref='parent')
+    configure_mappers()
+    return Parent, Child
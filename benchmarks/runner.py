@@ -0,0 +1,183 @@
+# runner.py
+# Copyright (C) 2012 the ColanderAlchemy authors and contributors
+# <see AUTHORS file>
+#
+# This module is part of ColanderAlchemy and is released under
+# the MIT License: http://www.opensource.org/licenses/mit-license.php
+
+""" Helpers shared by the benchmark suites.
+
+Results are collected by a :class:`Runner` and written as JSON, so that the
+results of two commits can be compared with ``python -m benchmarks.compare``.
+"""
+
+import argparse
+import datetime
+import gc
+import json
+import platform
+import subprocess
+import sys
+import timeit
+import tracemalloc
+
+import colander
+import sqlalchemy
+
+
+def _colander_version():
+    try:
+        from importlib import metadata
+        return metadata.version('colander')
+    except Exception:
+        return getattr(colander, '__version__', 'unknown')
+
+
+def _git_commit():
+    try:
+        output = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                         stderr=subprocess.STDOUT)
+    except Exception:
+        return None
+    return output.decode('ascii').strip()
+
+
+def metadata():
+    """ Return information about the environment running the benchmarks. """
+    return dict(
+        timestamp=datetime.datetime.utcnow().isoformat(),
+        commit=_git_commit(),
+        python=sys.version.split()[0],
+        implementation=platform.python_implementation(),
+        platform=platform.platform(),
+        sqlalchemy=sqlalchemy.__version__,
+        colander=_colander_version(),
+    )
+
+
+class Runner(object):
+    """ Run benchmarks and collect their results. """
+
+    def __init__(self, suite, quick=False, pattern=None, repeat=5):
+        self.suite = suite
+        self.quick = quick
+        self.pattern = pattern
+        self.repeat = 3 if quick else repeat
+        self.results = []
+
+    def enabled(self, name):
+        return self.pattern is None or self.pattern in name
+
+    def time(self, name, func, setup=None, number=1, items=None, **params):
+        """ Time ``func``, called ``number`` times per repetition.
+
+        ``setup`` is called, untimed, before each repetition.  If ``items``
+        is given, it is the number of items processed by each call and the
+        throughput is reported as well.
+        """
+        if not self.enabled(name):
+            return None
+        timings = []
+        for _ in range(self.repeat):
+            if setup is not None:
+                setup()
+            gc.collect()
+            timer = timeit.Timer(func)
+            timings.append(timer.timeit(number) / number)
+        timings.sort()
+        result = dict(name=name,
+                      kind='time',
+                      params=params,
+                      repeat=self.repeat,
+                      number=number,
+                      min=timings[0],
+                      median=timings[len(timings) // 2],
+                      mean=sum(timings) / len(timings),
+                      unit='s')
+        if items:
+            result['items'] = items
+            result['throughput'] = items / timings[0]
+        self.report(result)
+        return result
+
+    def memory(self, name, func, setup=None, **params):
+        """ Measure the memory allocated by one call of ``func``.
+
+        Reports the peak of traced memory during the call and the number of
+        allocated blocks still alive when it returns, which includes the
+        result of ``func``.
+        """
+        if not self.enabled(name):
+            return None
+        if setup is not None:
+            setup()
+        gc.collect()
+        tracemalloc.start()
+        try:
+            before = tracemalloc.take_snapshot()
+            result = func()
+            after = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        stats = after.compare_to(before, 'filename')
+        blocks = sum(stat.count_diff for stat in stats)
+        del result
+        result = dict(name=name,
+                      kind='memory',
+                      params=params,
+                      peak=peak,
+                      retained=current,
+                      blocks=blocks,
+                      unit='B')
+        self.report(result)
+        return result
+
+    def report(self, result):
+        self.results.append(result)
+        if result['kind'] == 'time':
+            line = '%-50s %12.6f s' % (result['name'], result['min'])
+            if 'throughput' in result:
+                line += ' %14.1f items/s' % result['throughput']
+        else:
+            line = '%-50s %12.1f KiB peak %12.1f KiB retained' % (
+                result['name'], result['peak'] / 1024.0,
+                result['retained'] / 1024.0)
+        sys.stderr.write(line + '\n')
+
+    def dump(self, stream):
+        json.dump(dict(suite=self.suite,
+                       quick=self.quick,
+                       metadata=metadata(),
+                       results=self.results),
+                  stream, indent=2, sort_keys=True)
+        stream.write('\n')
+
+
+def main(suite, run, description, argv=None):
+    """ Command line entry point of a benchmark suite.
+
+    ``run`` is called with a :class:`Runner` and must run the benchmarks.
+    """
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('-o', '--output',
+                        help='write the results as JSON to this file '
+                             '(default: standard output)')
+    parser.add_argument('-q', '--quick', action='store_true',
+                        help='use smaller sizes and fewer repetitions')
+    parser.add_argument('-k', '--filter', dest='pattern',
+                        help='only run benchmarks whose name contains '
+                             'this string')
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+                        help='number of repetitions (default: 5)')
+    args = parser.parse_args(argv)
+
+    runner = Runner(suite, quick=args.quick, pattern=args.pattern,
+                    repeat=args.repeat)
+    run(runner)
+    if args.output:
+        with open(args.output, 'w') as stream:
+            runner.dump(stream)
+    else:
+        runner.dump(sys.stdout)
+    return runner
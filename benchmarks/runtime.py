@@ -0,0 +1,173 @@
+# runtime.py
+# Copyright (C) 2012 the ColanderAlchemy authors and contributors
+# <see AUTHORS file>
+#
+# This module is part of ColanderAlchemy and is released under
+# the MIT License: http://www.opensource.org/licenses/mit-license.php
+
+""" Benchmarks of dictify, objectify, serialize and deserialize.
+
+Run with::
+
+    python -m benchmarks.runtime --output runtime.json
+
+Objects are stored in an in-memory SQLite database and loaded, with their
+relationships, before measuring, so that the measurements do not include
+database access.  Object graphs are flat rows, one-to-many collections of
+several sizes and nested many-to-one chains.
+"""
+
+import warnings
+
+from sqlalchemy import (create_engine, exc, inspect)
+from sqlalchemy.orm import (joinedload, selectinload, Session)
+
+from colanderalchemy import SQLAlchemySchemaNode
+
+from benchmarks import models
+from benchmarks.runner import main
+
+
+# SQLite stores Numeric columns as floating point numbers.
+warnings.filterwarnings('ignore', '.*Decimal objects natively',
+                        exc.SAWarning)
+
+
+def _session(metadata):
+    engine = create_engine('sqlite://')
+    metadata.create_all(engine)
+    return Session(engine)
+
+
+def flat(rows):
+    """ Return a schema and ``rows`` loaded instances of a flat model. """
+    Flat = models.wide_model(20)
+    session = _session(Flat.metadata)
+    session.add_all([Flat(**models.values(Flat, i)) for i in range(rows)])
+    session.commit()
+    session.expunge_all()
+    return SQLAlchemySchemaNode(Flat), session.query(Flat).all(), rows
+
+
+def one_to_many(children):
+    """ Return a schema and a loaded parent with ``children`` children. """
+    Parent, Child = models.one_to_many()
+    session = _session(Parent.metadata)
+    parent = Parent(**models.values(Parent, 0))
+    parent.children = [Child(**models.values(Child, i))
+                       for i in range(children)]
+    session.add(parent)
+    session.commit()
+    session.expunge_all()
+    parent = session.query(Parent).options(
+        selectinload(Parent.children)).one()
+    return SQLAlchemySchemaNode(Parent), [parent], children + 1
+
+
+def chain(depth, rows):
+    """ Return a schema and ``rows`` loaded heads of many-to-one chains of
+    ``depth`` objects.
+    """
+    Head = models.chain(depth)
+    session = _session(Head.metadata)
+    classes = [Head]
+    while 'next' in inspect(classes[-1]).relationships:
+        classes.append(classes[-1].next.property.mapper.class_)
+    for i in range(rows):
+        obj = None
+        for class_ in reversed(classes):
+            link = class_(**models.values(class_, i))
+            if obj is not None:
+                link.next = obj
+            obj = link
+        session.add(obj)
+    session.commit()
+    session.expunge_all()
+    heads = session.query(Head).all()
+    # Load the whole chains.
+    for head in heads:
+        obj = head
+        while obj is not None:
+            obj = getattr(obj, 'next', None)
+    return SQLAlchemySchemaNode(Head), heads, rows * depth
+
+
+def fan_in(rows, targets):
+    """ Return a schema and ``rows`` loaded objects with a many-to-one
+    relationship to one of ``targets`` objects.
+    """
+    Head = models.chain(2)
+    Target = Head.next.property.mapper.class_
+    session = _session(Head.metadata)
+    shared = [Target(**models.values(Target, i)) for i in range(targets)]
+    session.add_all([Head(next=shared[i % targets], **models.values(Head, i))
+                     for i in range(rows)])
+    session.commit()
+    session.expunge_all()
+    heads = session.query(Head).options(joinedload(Head.next)).all()
+    return SQLAlchemySchemaNode(Head), heads, rows
+
+
+def run(runner):
+    quick = runner.quick
+    cases = [
+        ('flat', lambda: flat(100 if quick else 10000)),
+        ('one_to_many.10', lambda: one_to_many(10)),
+        ('one_to_many.1000', lambda: one_to_many(1000)),
+        ('chain.10', lambda: chain(10, 10 if quick else 100)),
+        ('fan_in', lambda: fan_in(100 if quick else 10000, 12)),
+    ]
+    if not quick:
+        cases.insert(3, ('one_to_many.100000',
+                         lambda: one_to_many(100000)))
+
+    for name, build in cases:
+        if not any(runner.enabled('%s.%s' % (path, name))
+                   for path in ('dictify', 'dictify_many',
+                                'dictify_many_memo', 'objectify',
+                                'serialize', 'deserialize', 'to_cstruct',
+                                'to_cstruct_many')):
+            continue
+        schema, objs, items = build()
+        appstructs = [schema.dictify(obj) for obj in objs]
+        cstructs = [schema.serialize(appstruct) for appstruct in appstructs]
+
+        runner.time('dictify.%s' % name,
+                    lambda: [schema.dictify(obj) for obj in objs],
+                    items=items)
+        runner.time('dictify_many.%s' % name,
+                    lambda: schema.dictify_many(objs),
+                    items=items)
+        runner.time('dictify_many_memo.%s' % name,
+                    lambda: schema.dictify_many(objs, memo=True),
+                    items=items)
+        runner.time('objectify.%s' % name,
+                    lambda: [schema.objectify(appstruct)
+                             for appstruct in appstructs],
+                    items=items)
+        runner.time('serialize.%s' % name,
+                    lambda: [schema.serialize(appstruct)
+                             for appstruct in appstructs],
+                    items=items)
+        runner.time('to_cstruct.%s' % name,
+                    lambda: [schema.to_cstruct(obj) for obj in objs],
+                    items=items)
+        runner.time('to_cstruct_many.%s' % name,
+                    lambda: schema.to_cstruct_many(objs),
+                    items=items)
+        runner.time('deserialize.%s' % name,
+                    lambda: [schema.deserialize(cstruct)
+                             for cstruct in cstructs],
+                    items=items)
+
+        runner.memory('memory.dictify.%s' % name,
+                      lambda: [schema.dictify(obj) for obj in objs],
+                      items=items)
+        runner.memory('memory.objectify.%s' % name,
+                      lambda: [schema.objectify(appstruct)
+                               for appstruct in appstructs],
+                      items=items)
+
+
+if __name__ == '__main__':
+    main('runtime', run, __doc__.strip().splitlines()[0])
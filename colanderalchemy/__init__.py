@@ -5,9 +5,15 @@
 # This module is part of ColanderAlchemy and is released under
 # the MIT License: http://www.opensource.org/licenses/mit-license.php
 
+import threading
+
 from .schema import SQLAlchemySchemaNode
+from .cache import (SchemaCache, get_schema, schema_cache)
+from .registry import (TypeRegistry, register_type, type_registry)
 
-__all__ = ['SQLAlchemySchemaNode']
+__all__ = ['SQLAlchemySchemaNode', 'SchemaCache', 'get_schema',
+           'schema_cache', 'TypeRegistry', 'register_type', 'type_registry',
+           'setup_schema', 'setup_lazy_schema', 'warm_all']
 
 
 __colanderalchemy__ = '__colanderalchemy__'
@@ -35,3 +41,79 @@ def setup_schema(mapper, class_):
         and the like.
     """
     setattr(class_, __colanderalchemy__, SQLAlchemySchemaNode(class_))
+
+
+class _LazySchema(object):
+    """ Descriptor building the schema of ``class_`` on first access.
+
+    Once built, the schema replaces the descriptor on the class, so later
+    lookups are plain attribute accesses.
+    """
+
+    def __init__(self, class_):
+        self.class_ = class_
+        self.lock = threading.Lock()
+
+    def __get__(self, instance, owner):
+        with self.lock:
+            schema = self.class_.__dict__.get(__colanderalchemy__)
+            if schema is self:
+                schema = self.build()
+                setattr(self.class_, __colanderalchemy__, schema)
+        return schema
+
+    def build(self):
+        return SQLAlchemySchemaNode(self.class_)
+
+
+def setup_lazy_schema(mapper, class_):
+    """ Attach a Colander schema to ``class_`` that is built on first use.
+
+    This method is a drop-in replacement for :func:`setup_schema`: the
+    schema is available as the ``__colanderalchemy__`` attribute of
+    ``class_`` but it is only built, once and in a thread-safe way, the
+    first time that attribute is accessed.  This avoids paying the cost of
+    building every schema when mappers are configured.
+
+    See :func:`warm_all` to build every lazy schema up front, for instance
+    before forking worker processes.
+
+    Arguments/Keywords
+
+    mapper
+        The mapper associated with the given ``class_``.  This is typically
+        passed automatically via the SQLAlchemy event handler.
+
+        May be specified as ``None`` if this method is being called manually.
+
+    class\_
+        The SQLAlchemy mapped class. This class may have
+        attributes, related mapped classes (via SQLAlchemy relationships)
+        and the like.
+    """
+    setattr(class_, __colanderalchemy__, _LazySchema(class_))
+
+
+def warm_all(base):
+    """ Build the lazy schemas attached by :func:`setup_lazy_schema`.
+
+    Every schema attached to ``base`` or to any of its subclasses, such as
+    all the models of a declarative base, is built if it has not been built
+    yet.  Calling this before forking worker processes lets the workers
+    share the schemas in copy-on-write memory instead of each building its
+    own.  Returns the number of schemas built.
+
+    Arguments/Keywords
+
+    base
+        A mapped class or declarative base.
+    """
+    built = 0
+    classes = [base]
+    while classes:
+        class_ = classes.pop()
+        classes.extend(class_.__subclasses__())
+        if isinstance(class_.__dict__.get(__colanderalchemy__), _LazySchema):
+            getattr(class_, __colanderalchemy__)
+            built += 1
+    return built
@@ -0,0 +1,111 @@
+# aio.py
+# Copyright (C) 2012 the ColanderAlchemy authors and contributors
+# <see AUTHORS file>
+#
+# This module is part of ColanderAlchemy and is released under
+# the MIT License: http://www.opensource.org/licenses/mit-license.php
+
+""" Counterparts of :meth:`SQLAlchemySchemaNode.dictify` and
+:meth:`SQLAlchemySchemaNode.objectify` for :mod:`sqlalchemy.ext.asyncio`.
+
+This module requires Python 3.5 and SQLAlchemy 1.4 or later.
+"""
+
+from sqlalchemy.ext.asyncio import async_object_session
+
+
+__all__ = ['async_dictify', 'async_dictify_many', 'async_objectify']
+
+
+def _session(session, obj):
+    if session is None and obj is not None:
+        session = async_object_session(obj)
+    return session
+
+
+async def _run(session, func, *args, **kw):
+    if session is None:
+        # Transient and detached objects have nothing left to load.
+        return func(*args, **kw)
+
+    def run(sync_session):
+        return func(*args, **kw)
+
+    return await session.run_sync(run)
+
+
+async def async_dictify(schema, obj, session=None, memo=False, fields=None,
+                        max_depth=None):
+    """ Return the dictified version of ``obj``, loading relationships as
+    needed.
+
+    With an :class:`~sqlalchemy.ext.asyncio.AsyncSession`, reading an
+    attribute which is not loaded yet raises
+    :exc:`~sqlalchemy.exc.MissingGreenlet`.  This coroutine runs
+    :meth:`SQLAlchemySchemaNode.dictify` through
+    :meth:`~sqlalchemy.ext.asyncio.AsyncSession.run_sync`, so that every
+    relationship and deferred column read by the schema is loaded by
+    awaiting the database, following the same plan as the synchronous
+    path.  Only one operation can run at a time on a session: do not
+    ``gather`` several calls on objects of the same session, use
+    :func:`async_dictify_many` instead.  Use
+    :meth:`SQLAlchemySchemaNode.get_loader_options` to load the
+    relationships with the objects.
+
+    Arguments/Keywords
+
+    schema
+        The :class:`SQLAlchemySchemaNode` used to dictify ``obj``.
+    obj
+        An object instance to be converted to a ``dict`` structure.
+    session
+        The :class:`~sqlalchemy.ext.asyncio.AsyncSession` used to load
+        attributes.  Default: the session ``obj`` belongs to.
+    memo, fields, max_depth
+        See :meth:`SQLAlchemySchemaNode.dictify`.
+    """
+    return await _run(_session(session, obj), schema.dictify, obj, memo,
+                      fields, max_depth)
+
+
+async def async_dictify_many(schema, objs, session=None, memo=False,
+                             fields=None, max_depth=None):
+    """ Return a list of dictified versions of ``objs``.
+
+    This is the counterpart of :meth:`SQLAlchemySchemaNode.dictify_many`;
+    see :func:`async_dictify`.  ``objs`` must be a sequence of objects
+    belonging to the same session, such as the result of
+    ``(await session.scalars(statement)).all()``.
+    """
+    objs = list(objs)
+    if session is None:
+        for obj in objs:
+            session = async_object_session(obj)
+            if session is not None:
+                break
+    return await _run(session, schema.dictify_many, objs, memo, fields,
+                      max_depth)
+
+
+async def async_objectify(schema, dict_, context=None, session=None):
+    """ Return an object representing ``dict_``, loading the attributes of
+    ``context`` as needed.
+
+    Updating the relationships of a persistent ``context`` loads their
+    current value first, which requires awaiting the database.  This
+    coroutine runs :meth:`SQLAlchemySchemaNode.objectify` through
+    :meth:`~sqlalchemy.ext.asyncio.AsyncSession.run_sync` for that
+    purpose.
+
+    Arguments/Keywords
+
+    schema
+        The :class:`SQLAlchemySchemaNode` used to objectify ``dict_``.
+    dict\\_, context
+        See :meth:`SQLAlchemySchemaNode.objectify`.
+    session
+        The :class:`~sqlalchemy.ext.asyncio.AsyncSession` used to load
+        attributes.  Default: the session ``context`` belongs to.
+    """
+    return await _run(_session(session, context), schema.objectify, dict_,
+                      context)
@@ -0,0 +1,213 @@
+# cache.py
+# Copyright (C) 2012 the ColanderAlchemy authors and contributors
+# <see AUTHORS file>
+#
+# This module is part of ColanderAlchemy and is released under
+# the MIT License: http://www.opensource.org/licenses/mit-license.php
+
+import collections
+import logging
+import threading
+import types
+import weakref
+
+import colander
+from sqlalchemy import event
+from sqlalchemy.orm import Mapper
+
+from .schema import (SQLAlchemySchemaNode, _freeze)
+
+
+__all__ = ['SchemaCache', 'get_schema', 'schema_cache']
+
+log = logging.getLogger(__name__)
+
+
+# Every SchemaCache instance, emptied when SQLAlchemy configures mappers.
+_caches = weakref.WeakSet()
+
+# Values compared by identity which are nevertheless stable keys.
+_stable_types = (type, types.FunctionType, types.BuiltinFunctionType,
+                 types.MethodType, types.ModuleType)
+_markers = (colander.null, colander.drop, colander.required)
+
+
+@event.listens_for(Mapper, 'after_configured')
+def _invalidate_caches():
+    for cache in list(_caches):
+        cache.invalidate()
+
+
+def _check_stable(obj):
+    """ Raise a :exc:`TypeError` if ``obj`` contains instances compared by
+    identity, such as ``colander.String()``: a new instance is built for
+    every schema requested, which would never match a cached schema.
+    """
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            _check_stable(key)
+            _check_stable(value)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            _check_stable(item)
+    elif (obj is not None and type(obj).__hash__ is object.__hash__
+            and not isinstance(obj, _stable_types)
+            and not any(obj is marker for marker in _markers)):
+        raise TypeError('%r is compared by identity' % (obj,))
+
+
+def fingerprint(class_, includes=None, excludes=None, overrides=None,
+                unknown='ignore', **kw):
+    """ Return a hashable key describing a schema configuration.
+
+    The arguments are those accepted by
+    :class:`colanderalchemy.SQLAlchemySchemaNode`.  A :exc:`TypeError` is
+    raised if any of them cannot be represented in a stable way, including
+    instances compared by identity such as Colander types or validators.
+    """
+    for value in (includes, excludes, overrides, kw):
+        _check_stable(value)
+    return (class_,
+            _freeze(includes or ()),
+            _freeze(excludes or ()),
+            _freeze(overrides or {}),
+            unknown,
+            _freeze(kw))
+
+
+class SchemaCache(object):
+    """ A thread-safe LRU cache of :class:`SQLAlchemySchemaNode` instances.
+
+    Schemas are keyed by the mapped class and by a fingerprint of the
+    ``includes``, ``excludes``, ``overrides``, ``unknown`` and other keyword
+    arguments used to build them, so that requesting the same configuration
+    twice returns the very same schema instead of walking the mapper again.
+
+    The schemas handed out are shared between all callers and must be
+    treated as read-only.  Use :meth:`colander.SchemaNode.clone` (or
+    :meth:`colander.SchemaNode.bind`, which clones) to obtain a private
+    copy that can be modified.
+
+    The cache is emptied whenever SQLAlchemy configures new mappers, as
+    relationships (and thus schemas) may have changed.
+
+    Configurations holding instances compared by identity, such as
+    ``overrides={'name': {'typ': colander.String()}}``, are built every time
+    and never stored, since every call passes a new instance.  Pass the
+    class instead, as in ``{'typ': colander.String}``, or use functions,
+    classes and :attr:`colander.null`, :attr:`colander.drop` or
+    :attr:`colander.required` as values.
+    """
+
+    def __init__(self, maxsize=128, schema_class=SQLAlchemySchemaNode):
+        """ Initialise an empty cache.
+
+        Arguments/Keywords
+
+        maxsize
+            Maximum number of schemas held by the cache.  When the limit is
+            reached, the least recently used schema is evicted.  ``None``
+            means the cache is unbounded.  Default: 128.
+        schema_class
+            The class used to build schemas on a cache miss.
+            Default: :class:`SQLAlchemySchemaNode`.
+        """
+        self.maxsize = maxsize
+        self.schema_class = schema_class
+        self.hits = 0
+        self.misses = 0
+        self._schemas = collections.OrderedDict()
+        self._lock = threading.RLock()
+        _caches.add(self)
+
+    def get(self, class_, includes=None, excludes=None, overrides=None,
+            unknown='ignore', **kw):
+        """ Return a schema for ``class_``, building it on a cache miss.
+
+        Accepts the same arguments as :class:`SQLAlchemySchemaNode`.
+        Configurations that cannot be fingerprinted (for instance because
+        ``overrides`` contain unhashable values or Colander type instances)
+        are built every time and never stored.
+        """
+        try:
+            key = fingerprint(class_, includes, excludes, overrides,
+                              unknown, **kw)
+        except TypeError:
+            log.debug('Schema for %s cannot be cached: unstable '
+                      'configuration', class_)
+            key = None
+
+        if key is not None:
+            with self._lock:
+                schema = self._schemas.get(key)
+                if schema is not None:
+                    self.hits += 1
+                    self._move_to_end(key)
+                    return schema
+                self.misses += 1
+
+        schema = self.schema_class(class_, includes, excludes, overrides,
+                                   unknown, **kw)
+        if key is None:
+            return schema
+
+        with self._lock:
+            # Another thread may have built the same schema meanwhile; keep
+            # the first one so that every caller shares a single instance.
+            schema = self._schemas.setdefault(key, schema)
+            self._move_to_end(key)
+            while (self.maxsize is not None
+                   and len(self._schemas) > self.maxsize):
+                self._schemas.popitem(last=False)
+        return schema
+
+    def _move_to_end(self, key):
+        schema = self._schemas.pop(key)
+        self._schemas[key] = schema
+
+    def invalidate(self, class_=None):
+        """ Drop every cached schema built for ``class_``.
+
+        If ``class_`` is ``None``, every cached schema is dropped.  Unlike
+        :meth:`clear`, the hit/miss counters are left untouched.
+        """
+        with self._lock:
+            if class_ is None:
+                self._schemas.clear()
+                return
+            for key in [key for key in self._schemas if key[0] is class_]:
+                del self._schemas[key]
+
+    def clear(self):
+        """ Drop every cached schema and reset the hit/miss counters. """
+        with self._lock:
+            self._schemas.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        """ Return a dict with ``hits``, ``misses``, ``maxsize`` and
+        ``currsize`` statistics for this cache.
+        """
+        with self._lock:
+            return dict(hits=self.hits,
+                        misses=self.misses,
+                        maxsize=self.maxsize,
+                        currsize=len(self._schemas))
+
+    def __len__(self):
+        return len(self._schemas)
+
+
+schema_cache = SchemaCache()
+
+
+def get_schema(class_, includes=None, excludes=None, overrides=None,
+               unknown='ignore', **kw):
+    """ Return a shared :class:`SQLAlchemySchemaNode` for ``class_``.
+
+    This is a shortcut for :meth:`SchemaCache.get` on the process-wide
+    ``schema_cache``; see :class:`SchemaCache` for details.
+    """
+    return schema_cache.get(class_, includes, excludes, overrides,
+                            unknown, **kw)
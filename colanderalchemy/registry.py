@@ -0,0 +1,169 @@
+# registry.py
+# Copyright (C) 2012 the ColanderAlchemy authors and contributors
+# <see AUTHORS file>
+#
+# This module is part of ColanderAlchemy and is released under
+# the MIT License: http://www.opensource.org/licenses/mit-license.php
+
+import threading
+
+import colander
+from sqlalchemy import (Boolean,
+                        Date,
+                        DateTime,
+                        Enum,
+                        Float,
+                        Integer,
+                        String,
+                        Numeric,
+                        Time)
+
+
+__all__ = ['TypeRegistry', 'register_type', 'type_registry']
+
+
+def _boolean(column):
+    return dict(typ=colander.Boolean())
+
+
+def _date(column):
+    return dict(typ=colander.Date())
+
+
+def _datetime(column):
+    return dict(typ=colander.DateTime(default_tzinfo=None))
+
+
+def _enum(column):
+    return dict(typ=colander.String(),
+                validator=colander.OneOf(column.type.enums))
+
+
+def _float(column):
+    return dict(typ=colander.Float())
+
+
+def _integer(column):
+    return dict(typ=colander.Integer())
+
+
+def _string(column):
+    return dict(typ=colander.String(),
+                validator=colander.Length(0, column.type.length))
+
+
+def _numeric(column):
+    return dict(typ=colander.Decimal())
+
+
+def _time(column):
+    return dict(typ=colander.Time())
+
+
+class TypeRegistry(object):
+    """ Map SQLAlchemy column types to Colander schema node arguments.
+
+    A factory is registered for a SQLAlchemy type class and applies to that
+    class and all of its subclasses, the most specific registration
+    winning.  Lookups walk the method resolution order of the column type
+    once; the result is then cached per concrete type class.
+    """
+
+    def __init__(self, factories=None):
+        """ Initialise the registry.
+
+        Arguments/Keywords
+
+        factories
+            Optional dict-like structure mapping SQLAlchemy type classes to
+            factories, as accepted by :meth:`register`.
+        """
+        self._factories = {}
+        self._resolved = {}
+        self._lock = threading.Lock()
+        for type_, factory in (factories or {}).items():
+            self.register(type_, factory)
+
+    def register(self, type_, factory):
+        """ Register ``factory`` for the SQLAlchemy type class ``type_``.
+
+        Arguments/Keywords
+
+        type\\_
+            A SQLAlchemy type class, such as :class:`sqlalchemy.Integer`,
+            :class:`sqlalchemy.dialects.postgresql.UUID` or a custom
+            :class:`sqlalchemy.types.TypeDecorator`.
+        factory
+            A callable accepting the :class:`sqlalchemy.Column` being mapped
+            and returning a dict of keyword arguments for
+            :class:`colander.SchemaNode`, which must include the ``typ``
+            key.  A :class:`colander.SchemaType` subclass may be given
+            instead, in which case it is instantiated without arguments.
+        """
+        if (isinstance(factory, type)
+                and issubclass(factory, colander.SchemaType)):
+            factory = _type_factory(factory)
+        with self._lock:
+            self._factories[type_] = factory
+            self._resolved.clear()
+
+    def unregister(self, type_):
+        """ Remove the factory registered for ``type_``. """
+        with self._lock:
+            del self._factories[type_]
+            self._resolved.clear()
+
+    def lookup(self, type_):
+        """ Return the factory for the SQLAlchemy type class ``type_``.
+
+        Returns ``None`` if neither ``type_`` nor any of its bases has a
+        registered factory.
+        """
+        try:
+            return self._resolved[type_]
+        except KeyError:
+            pass
+        factory = None
+        for cls in type_.__mro__:
+            factory = self._factories.get(cls)
+            if factory is not None:
+                break
+        self._resolved[type_] = factory
+        return factory
+
+    def copy(self):
+        """ Return a new registry holding the same factories. """
+        return self.__class__(self._factories)
+
+
+def _type_factory(colander_type):
+    def factory(column):
+        return dict(typ=colander_type())
+    return factory
+
+
+type_registry = TypeRegistry({
+    Boolean: _boolean,
+    Date: _date,
+    DateTime: _datetime,
+    Enum: _enum,
+    Float: _float,
+    Integer: _integer,
+    String: _string,
+    Numeric: _numeric,
+    Time: _time,
+})
+
+
+def register_type(type_, factory):
+    """ Register ``factory`` for ``type_`` in the default registry.
+
+    This is a shortcut for :meth:`TypeRegistry.register` on the registry
+    used by :class:`colanderalchemy.SQLAlchemySchemaNode`.  For example::
+
+        from sqlalchemy.dialects.postgresql import UUID
+        import colander
+
+        register_type(UUID, colander.String)
+    """
+    type_registry.register(type_, factory)
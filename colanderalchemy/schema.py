@@ -5,8 +5,13 @@
 # This module is part of ColanderAlchemy and is released under
 # the MIT License: http://www.opensource.org/licenses/mit-license.php
 
+import array
+import collections
 import logging
 import itertools
+import operator
+import threading
+import weakref
 
 import colander
 from colander import (Mapping,
@@ -14,24 +19,238 @@ from colander import (Mapping,
                       required,
                       SchemaNode,
                       Sequence)
-from sqlalchemy import (Boolean,
-                        Date,
-                        DateTime,
-                        Enum,
-                        Float,
-                        inspect,
-                        Integer,
-                        String,
-                        Numeric,
-                        Time)
+from sqlalchemy import (event, inspect, orm, select, tuple_)
 from sqlalchemy.schema import (FetchedValue, ColumnDefault, Column)
-from sqlalchemy.orm import (ColumnProperty, RelationshipProperty)
+from sqlalchemy.orm import (ColumnProperty,
+                            Mapper,
+                            RelationshipProperty,
+                            Session,
+                            object_session)
+from sqlalchemy.orm.exc import UnmappedColumnError
+
+from .registry import type_registry
 
 
 __all__ = ['SQLAlchemySchemaNode']
 
 log = logging.getLogger(__name__)
 
+_node_name = operator.attrgetter('name')
+
+# Array type codes used by dictify_columns, by Colander type.
+_array_types = [(colander.Boolean, 'b', 'bool_'),
+                (colander.Integer, 'q', 'int64'),
+                (colander.Float, 'd', 'float64')]
+
+# NumPy, imported by _array on first use: importing it at startup would slow
+# down every process importing ColanderAlchemy.
+_numpy = None
+
+# Serialises the materialisation of lazy schema nodes across threads.
+_lazy_lock = threading.RLock()
+
+# Private schemas whose child nodes are copied by the schemas built with
+# reuse_nodes, keyed by their configuration.
+_node_sources = weakref.WeakValueDictionary()
+# Mapped classes reachable through relationships, keyed by mapped class.
+_reachable_classes = {}
+
+
+def _clear_node_sources():
+    _node_sources.clear()
+    _reachable_classes.clear()
+
+# New mappers may add relationships (e.g. backrefs) to existing classes.
+event.listen(Mapper, 'after_configured', _clear_node_sources)
+
+
+def _freeze(obj):
+    """ Return a hashable, order independent representation of ``obj``.
+
+    Dicts, lists, tuples and sets are converted recursively; any other value
+    is used as is and must therefore be hashable.  A :exc:`TypeError` is
+    raised otherwise.
+    """
+    if isinstance(obj, dict):
+        items = [(_freeze(key), _freeze(value))
+                 for key, value in obj.items()]
+        return ('dict', tuple(sorted(items, key=lambda item: repr(item[0]))))
+    elif isinstance(obj, (list, tuple)):
+        return ('seq', tuple(_freeze(item) for item in obj))
+    elif isinstance(obj, (set, frozenset)):
+        return ('set', frozenset(_freeze(item) for item in obj))
+    hash(obj)
+    # Keep the type as part of the key so that values comparing equal
+    # across types (e.g. ``1`` and ``True``) do not share a schema.
+    return (obj.__class__, obj)
+
+
+def _reachable(class_):
+    """ Return the set of mapped classes reachable from ``class_`` by
+    following relationships.
+    """
+    try:
+        return _reachable_classes[class_]
+    except KeyError:
+        pass
+    reachable = set()
+    pending = [class_]
+    while pending:
+        for prop in inspect(pending.pop()).relationships:
+            target = prop.mapper.class_
+            if target not in reachable:
+                reachable.add(target)
+                pending.append(target)
+    _reachable_classes[class_] = reachable
+    return reachable
+
+
+# Kinds of the nodes of a dictify plan.
+_COLUMN = 'column'
+_SCALAR = 'scalar'
+_COLLECTION = 'collection'
+
+# Loader options of the ``lazy`` strategies of relationships.
+_loaders = {
+    'select': 'lazyload',
+    'joined': 'joinedload',
+    'subquery': 'subqueryload',
+    'selectin': 'selectinload',
+    'immediate': 'immediateload',
+    'noload': 'noload',
+    'raise': 'raiseload',
+}
+
+# Number of keys in the IN clause of the queries loading collections.
+_batch_size = 500
+
+try:
+    _string_types = basestring
+except NameError:
+    _string_types = str
+
+# Maximum number of selections of fields cached, by schema and overall.
+_max_selections = 256
+# Selections of fields parsed by _parse_fields, keyed by specification.
+_parsed_fields = {}
+
+# Default of getattr() calls, for attributes missing on dictified objects.
+_missing = object()
+
+
+def _chunks(iterable, size):
+    """ Yield lists of at most ``size`` items of ``iterable``. """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _column_keys(mapper, columns):
+    """ Return the keys of the attributes of ``mapper`` mapping
+    ``columns``, ignoring the columns it does not map.
+    """
+    keys = set()
+    for column in columns:
+        try:
+            keys.add(mapper.get_property_by_column(column).key)
+        except UnmappedColumnError:
+            pass
+    return keys
+
+
+def _array(node, values):
+    """ Return ``values`` as an array if ``node`` has a numeric type and
+    every value fits in the array, otherwise return ``values`` unchanged.
+    """
+    for type_, code, dtype in _array_types:
+        if isinstance(node.typ, type_):
+            break
+    else:
+        return values
+    try:
+        values = array.array(code, values)
+    except (TypeError, OverflowError):
+        # Missing values, or values not stored as such by the column.
+        return values
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy as _numpy
+        except ImportError:  # pragma: no cover
+            _numpy = False
+    if _numpy:
+        return _numpy.array(values, getattr(_numpy, dtype))
+    return values
+
+
+def _none_value(node):
+    """ Return the appstruct value of ``node`` for ``None``. """
+    # SQLAlchemy mostly converts values into Python types
+    #  appropriate for appstructs, but not always.  The biggest
+    #  problems are around `None` values so we're dealing with
+    #  those here.  All types should accept `colander.null` so
+    #  we mostly change `None` into that.
+    if isinstance(node.typ, colander.String):
+        # colander has an issue with `None` on a String type
+        #  where it translates it into "None".  Let's check
+        #  for that specific case and turn it into a
+        #  `colander.null`.
+        return colander.null
+    # A specific case this helps is with Integer where
+    #  `None` is an invalid value.  We call serialize()
+    #  to test if we have a value that will work later
+    #  for serialization and then allow it if it doesn't
+    #  raise an exception.  Hopefully this also catches
+    #  issues with user defined types and future issues.
+    try:
+        node.serialize(None)
+    except:
+        return colander.null
+    return None
+
+
+def _parse_fields(fields):
+    """ Return the selection tree of the ``fields`` specification.
+
+    ``fields`` is a string of comma separated field names, or an iterable
+    of field names, where names of nested fields are dotted paths, such as
+    ``'id,name,owner.email'``.  The tree is a sorted tuple of ``(name,
+    subtree)`` pairs, where the subtree is ``None`` if every nested field
+    is selected.  Trees are cached per specification.
+    """
+    if not isinstance(fields, _string_types):
+        fields = tuple(fields)
+    try:
+        return _parsed_fields[fields]
+    except KeyError:
+        pass
+    paths = fields.split(',') if isinstance(fields, _string_types) else fields
+    tree = {}
+    for path in paths:
+        names = [name.strip() for name in path.split('.')]
+        if not all(names):
+            continue
+        branch = tree
+        for name in names[:-1]:
+            if name in branch and branch[name] is None:
+                # Every nested field is selected already.
+                break
+            branch = branch.setdefault(name, {})
+        else:
+            branch[names[-1]] = None
+
+    def freeze(tree):
+        return tuple(sorted((name, None if branch is None else freeze(branch))
+                            for name, branch in tree.items()))
+
+    if len(_parsed_fields) >= _max_selections:
+        _parsed_fields.clear()
+    selection = _parsed_fields[fields] = freeze(tree)
+    return selection
+
 
 def _creation_order(obj):
     """
@@ -50,9 +269,11 @@ class SQLAlchemySchemaNode(colander.SchemaNode):
 
     sqla_info_key = 'colanderalchemy'
     ca_class_key = '__colanderalchemy_config__'
+    type_registry = type_registry
 
     def __init__(self, class_, includes=None,
-                 excludes=None, overrides=None, unknown='ignore', **kw):
+                 excludes=None, overrides=None, unknown='ignore', lazy=False,
+                 reuse_nodes=False, **kw):
         """ Initialise the given mapped schema according to options provided.
 
         Arguments/Keywords
@@ -131,6 +352,42 @@ class SQLAlchemySchemaNode(colander.SchemaNode):
            method of this instance.
 
            Default: 'ignore'
+        lazy
+           If ``True``, the child nodes of this schema are not built when
+           the schema is created but the first time they are needed, that is
+           when the schema is iterated, indexed, serialized, deserialized,
+           dictified or objectified.  Relationships are mapped to lazy
+           schemas as well, so nested schemas which are never used are never
+           built.  Once built, a lazy schema behaves exactly like a regular
+           one.  Note that configuration errors (e.g. conflicting
+           ``includes`` and ``excludes``) are then only raised when the
+           child nodes are built.
+
+           ``lazy`` can be included in the ``__colanderalchemy_config__``
+           dict on a class to declaratively customise the resulting schema.
+
+           Default: False
+        reuse_nodes
+           If ``True``, the child nodes of schemas built with the same
+           configuration are only built once from the mapped class, and
+           each schema gets copies of them, made with :meth:`clone` the
+           first time its child nodes are needed.  This notably applies to
+           nested relationship schemas: when many classes have a
+           relationship to the same class, the schema of that class is only
+           built once.  Nodes are reused only when the ``includes``,
+           ``excludes`` and ``overrides`` are identical and the
+           relationships excluded to prevent cycles are the same.
+
+           This saves the cost of building the nodes, not memory: once
+           used, each schema has its own nodes, which can be changed without
+           affecting the other schemas.  The copies still refer to the same
+           Colander types, validators and other attribute values.
+
+           ``reuse_nodes`` can be included in the
+           ``__colanderalchemy_config__`` dict on a class to declaratively
+           customise the resulting schema.
+
+           Default: False
         \*\*kw
            Represents *all* other options able to be passed to a
            :class:`colander.SchemaNode`. Keywords passed will influence the
@@ -152,6 +409,8 @@ class SQLAlchemySchemaNode(colander.SchemaNode):
         declarative_excludes = kwargs.pop('excludes', {})
         declarative_overrides = kwargs.pop('overrides', {})
         unknown = kwargs.pop('unknown', unknown)
+        lazy = kwargs.pop('lazy', lazy)
+        reuse_nodes = kwargs.pop('reuse_nodes', reuse_nodes)
         parents_ = kwargs.pop('parents_', [])
 
         # The default type of this SchemaNode is Mapping.
@@ -162,9 +421,183 @@ class SQLAlchemySchemaNode(colander.SchemaNode):
         self.excludes = excludes or declarative_excludes
         self.overrides = overrides or declarative_overrides
         self.unknown = unknown
+        self.lazy = lazy
+        self.reuse_nodes = reuse_nodes
         self.declarative_overrides = {}
         self.kwargs = kwargs or {}
-        self.add_nodes(self.includes, self.excludes, self.overrides)
+        key = self._source_key() if reuse_nodes else None
+        if key is not None:
+            source = _node_sources.get(key)
+            if source is None:
+                source = _node_sources.setdefault(key,
+                                                  self._new_node_source())
+            self._copy_source_nodes(source)
+            return
+        if lazy:
+            # Child nodes are built by __getattr__ on first access.
+            del self.children
+            self._lazy_nodes = (self.includes, self.excludes, self.overrides)
+        else:
+            self.add_nodes(self.includes, self.excludes, self.overrides)
+
+    def __getattr__(self, name):
+        # Only called when regular attribute lookup fails, which is the case
+        # for ``children`` until the nodes of a lazy schema are built.
+        if name == 'children':
+            if '_lazy_nodes' in self.__dict__:
+                return self._build_lazy_nodes()
+            if '_node_source' in self.__dict__:
+                return self._build_copied_nodes()
+        raise AttributeError("'%s' object has no attribute '%s'"
+                             % (self.__class__.__name__, name))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # Mappers cannot be pickled; it is looked up again when unpickling.
+        del state['inspector']
+        state.pop('_dictify_plan', None)
+        state.pop('_child_index', None)
+        state.pop('_projection', None)
+        state.pop('_insert_plan', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if 'children' not in state:
+            # Lazy schema whose nodes are not built yet.
+            self.__dict__.pop('children', None)
+        self.inspector = inspect(self.class_)
+
+    def _source_key(self):
+        """ Return the key under which the children of this schema can be
+        reused, or ``None`` if its configuration is not hashable.
+        """
+        # Relationships to the parents of a schema are excluded, which only
+        # matters for the parents that can be reached from this class.
+        reachable = _reachable(self.class_)
+        parents = frozenset(class_ for class_ in self.parents_
+                            if class_ in reachable)
+        try:
+            return (self.__class__, self.class_, _freeze(self.includes),
+                    _freeze(self.excludes), _freeze(self.overrides),
+                    self.lazy, parents)
+        except TypeError:
+            log.debug('Nodes for %s cannot be reused: unhashable '
+                      'configuration', self.class_)
+            return None
+
+    def _new_node_source(self):
+        """ Return a private schema configured as this one, whose nodes
+        are copied by the schemas sharing its configuration.
+
+        The source is never handed out, so that changes made to the nodes
+        of a schema do not leak into the schemas built afterwards.
+        """
+        source = object.__new__(self.__class__)
+        source.__dict__.update(self.__dict__)
+        del source.children
+        source._lazy_nodes = (self.includes, self.excludes, self.overrides)
+        if not self.lazy:
+            # Raise configuration errors now, as for other schemas.
+            source.children
+        return source
+
+    def _copy_source_nodes(self, source):
+        """ Copy the children of ``source``, built identically, when they
+        are first needed.
+        """
+        self.declarative_overrides = source.declarative_overrides
+        del self.children
+        self._node_source = source
+
+    def _build_copied_nodes(self):
+        source = self.__dict__['_node_source']
+        children = source.children
+        with _lazy_lock:
+            if '_node_source' in self.__dict__:
+                self.children = [node.clone() for node in children]
+                del self._node_source
+            return self.__dict__['children']
+
+    def _own_children(self):
+        """ Prepare the children list of this schema to be changed. """
+        self.children
+        self._forget_children()
+
+    def _forget_children(self):
+        """ Drop what is derived from the child nodes of this schema. """
+        self.__dict__.pop('_dictify_plan', None)
+        self.__dict__.pop('_child_index', None)
+        self.__dict__.pop('_projection', None)
+        self.__dict__.pop('_insert_plan', None)
+
+    def _get_child_index(self):
+        """ Return a dict mapping names to child nodes.
+
+        The index is built on first use and rebuilt when the child nodes
+        are added, inserted, replaced, removed or found to have been
+        renamed.  When several nodes have the same name, the first one is
+        indexed, as returned by :meth:`colander.SchemaNode.get`.
+        """
+        children = self.children
+        index = self.__dict__.get('_child_index')
+        if (index is not None and index[0] is children
+                and index[1] == len(children)):
+            return index[2]
+        nodes = {}
+        for node in children:
+            nodes.setdefault(node.name, node)
+        self._child_index = (children, len(children), nodes)
+        return nodes
+
+    def get(self, name, default=None):
+        """ Return the subnode associated with ``name`` or ``default`` if
+        no such node exists.
+
+        Unlike :meth:`colander.SchemaNode.get`, the subnode is found with
+        an index rather than by scanning every child node.
+        """
+        node = self._get_child_index().get(name)
+        if node is not None and node.name == name:
+            return node
+        # Either the name is unknown, or nodes were renamed since they were
+        # indexed: scan the nodes, and index them again if that was the case.
+        node = super(SQLAlchemySchemaNode, self).get(name, _missing)
+        if node is _missing:
+            return default
+        self.__dict__.pop('_child_index', None)
+        return node
+
+    def add(self, node):
+        self._own_children()
+        super(SQLAlchemySchemaNode, self).add(node)
+
+    def insert(self, index, node):
+        self._own_children()
+        super(SQLAlchemySchemaNode, self).insert(index, node)
+
+    def __setitem__(self, name, newnode):
+        self._own_children()
+        return super(SQLAlchemySchemaNode, self).__setitem__(name, newnode)
+
+    def __delitem__(self, name):
+        self._own_children()
+        return super(SQLAlchemySchemaNode, self).__delitem__(name)
+
+    def _build_lazy_nodes(self):
+        with _lazy_lock:
+            if '_lazy_nodes' not in self.__dict__:
+                # Built by another thread in the meantime.
+                return self.__dict__['children']
+            # Build the nodes on a shallow copy so that other threads never
+            # see a partially populated ``children`` list.
+            builder = object.__new__(self.__class__)
+            builder.__dict__.update(self.__dict__)
+            builder.children = []
+            builder.add_nodes(*self._lazy_nodes)
+            self.children = builder.children
+            del self._lazy_nodes
+            return self.children
 
     def add_nodes(self, includes, excludes, overrides):
 
@@ -298,42 +731,19 @@ class SQLAlchemySchemaNode(colander.SchemaNode):
             log.debug('Column %s: type overridden via TypeDecorator: %s.',
                       name, type_)
 
-        elif isinstance(column_type, Boolean):
-            type_ = colander.Boolean()
-
-        elif isinstance(column_type, Date):
-            type_ = colander.Date()
-
-        elif isinstance(column_type, DateTime):
-            type_ = colander.DateTime(default_tzinfo=None)
-
-        elif isinstance(column_type, Enum):
-            type_ = colander.String()
-            kwargs["validator"] = colander.OneOf(column.type.enums)
-
-        elif isinstance(column_type, Float):
-            type_ = colander.Float()
-
-        elif isinstance(column_type, Integer):
-            type_ = colander.Integer()
-
-        elif isinstance(column_type, String):
-            type_ = colander.String()
-            kwargs["validator"] = colander.Length(0, column.type.length)
-
-        elif isinstance(column_type, Numeric):
-            type_ = colander.Decimal()
-
-        elif isinstance(column_type, Time):
-            type_ = colander.Time()
-
         else:
-            raise NotImplementedError(
-                'Not able to derive a colander type from sqlalchemy '
-                'type: %s  Please explicitly provide a colander '
-                '`typ` for the "%s" Column.'
-                % (repr(column_type), name)
-            )
+            factory = self.type_registry.lookup(type(column.type))
+            if factory is None and column_type is not column.type:
+                factory = self.type_registry.lookup(type(column_type))
+            if factory is None:
+                raise NotImplementedError(
+                    'Not able to derive a colander type from sqlalchemy '
+                    'type: %s  Please explicitly provide a colander '
+                    '`typ` for the "%s" Column.'
+                    % (repr(column_type), name)
+                )
+            kwargs.update(factory(column))
+            type_ = kwargs.pop('typ')
 
         """
         Add default values
@@ -560,6 +970,8 @@ class SQLAlchemySchemaNode(colander.SchemaNode):
                                     excludes=excludes,
                                     overrides=rel_overrides,
                                     missing=missing,
+                                    lazy=self.lazy,
+                                    reuse_nodes=self.reuse_nodes,
                                     parents_=self.parents_ + [self.class_])
 
         if prop.uselist:
@@ -569,7 +981,7 @@ class SQLAlchemySchemaNode(colander.SchemaNode):
 
         return node
 
-    def dictify(self, obj):
+    def dictify(self, obj, memo=False, fields=None, max_depth=None):
         """ Return a dictified version of `obj` using schema information.
 
         The schema will be used to choose what attributes will be
@@ -587,62 +999,621 @@ class SQLAlchemySchemaNode(colander.SchemaNode):
             example, ``obj`` should be an instance of this schema's
             mapped class, an instance of a sub-class, or something that
             has the same attributes.
+        memo
+            If ``True``, related objects reached several times, for
+            instance many-to-one relationships of many objects to the same
+            object, are dictified once and the resulting ``dict`` is
+            reused.  Objects are identified by their identity key, or by
+            their ``id()`` if they have none.  The returned structure may
+            then contain the same ``dict`` several times: use
+            :func:`copy.deepcopy` on it before modifying it.
+            Default: ``False``.
+        fields
+            The fields to include in the returned ``dict``, as a string of
+            comma separated names or an iterable of names.  Fields of
+            related objects are given as dotted paths, for instance
+            ``'email,person.name,person.addresses.street'``; selecting a
+            relationship without any nested field, such as ``'person'``,
+            selects every field of the related objects.  Relationships
+            which are not selected are never read, so they are not loaded.
+            Names which are not part of the schema are ignored.
+            Default: ``None``, which selects every field of the schema.
+        max_depth
+            The maximum number of relationships followed from ``obj``:
+            ``0`` only includes the columns of ``obj``, ``1`` the columns
+            of its related objects too, and so on.  Relationships deeper
+            than this are never read.
+            Default: ``None``, which follows every relationship of the
+            schema.
         """
-        dict_ = {}
-        for node in self:
+        if fields is not None:
+            fields = _parse_fields(fields)
+        return self._dictify(obj,
+                             self._check_dictify_plans(fields, max_depth),
+                             {} if memo else None)
 
-            name = node.name
+    def dictify_many(self, objs, memo=False, fields=None, max_depth=None):
+        """ Return a list of dictified versions of ``objs``.
+
+        This is equivalent to calling :meth:`dictify` for each object, but
+        the dictify plan of this schema is resolved only once.  Related
+        collections are dictified the same way.
+
+        Arguments/Keywords
+
+        objs
+            An iterable of objects to be converted to ``dict`` structures,
+            such as a list of instances or a :class:`sqlalchemy.orm.Query`.
+        memo
+            If ``True``, objects reached several times are dictified once,
+            across all of ``objs``; see :meth:`dictify`.
+            Default: ``False``.
+        fields
+            The fields to include; see :meth:`dictify`.
+        max_depth
+            The maximum number of relationships followed; see
+            :meth:`dictify`.
+        """
+        if fields is not None:
+            fields = _parse_fields(fields)
+        self._check_dictify_plans(fields, max_depth)
+        return self._dictify_many(objs, {} if memo else None, fields,
+                                  max_depth)
+
+    def _dictify_many(self, objs, memo, fields=None, max_depth=None):
+        plan = self._get_dictify_plan(fields, max_depth, False)
+        dictify = self._dictify
+        return [dictify(obj, plan, memo) for obj in objs]
+
+    def dictify_columns(self, objs, arrays=False, fields=None,
+                        max_depth=None):
+        """ Return the dictified versions of ``objs`` as columns.
+
+        The result is an ordered dict mapping each field to the list of its
+        values, one per object, as they would appear in the appstructs
+        returned by :meth:`dictify_many`.  It can be given directly to
+        ``pandas.DataFrame`` or ``pyarrow.table``.  The fields of
+        many-to-one relationships are flattened to dotted names such as
+        ``person.name``, and are :attr:`colander.null`, or ``None``, when
+        there is no related object.  Values of collections are lists of
+        appstructs.
+
+        Arguments/Keywords
+
+        objs
+            An iterable of objects, such as a list of instances or a
+            :class:`sqlalchemy.orm.Query`.
+        arrays
+            If ``True``, the values of ``Boolean``, ``Integer`` and
+            ``Float`` nodes are returned as NumPy arrays when NumPy is
+            installed, and as :class:`array.array` otherwise, unless some
+            of them are missing or cannot be stored in such arrays.
+            Default: ``False``.
+        fields
+            The fields to include; see :meth:`dictify`.
+        max_depth
+            The maximum number of relationships followed; see
+            :meth:`dictify`.
+        """
+        if fields is not None:
+            fields = _parse_fields(fields)
+        if not isinstance(objs, list):
+            objs = list(objs)
+        columns = collections.OrderedDict()
+        self._dictify_columns(objs,
+                              self._check_dictify_plans(fields, max_depth),
+                              '', columns, arrays)
+        return columns
+
+    def _dictify_columns(self, objs, plan, prefix, columns, arrays):
+        for name, kind, node, target, none, fields, depth in plan:
+            # Objects are None below a missing many-to-one relationship.
+            values = [none if obj is None else getattr(obj, name, _missing)
+                      for obj in objs]
+            if kind is _SCALAR:
+                target._dictify_columns(
+                    [None if value is _missing else value
+                     for value in values],
+                    target._get_dictify_plan(fields, depth, False),
+                    prefix + name + '.', columns, arrays)
+                continue
+            for i, value in enumerate(values):
+                if value is None:
+                    values[i] = none
+                elif value is _missing:
+                    values[i] = colander.null
+                elif kind is _COLLECTION:
+                    values[i] = target._dictify_many(value, None, fields,
+                                                     depth)
+            if arrays and kind is _COLUMN:
+                values = _array(node, values)
+            columns[prefix + name] = values
+
+    def iter_dictify(self, source, chunk_size=1000, chunks=False,
+                     expunge=True, memo=False):
+        """ Dictify the objects of ``source`` as they are loaded.
+
+        Unlike :meth:`dictify_many`, this is a generator which processes
+        ``chunk_size`` objects at a time, so that memory use is bounded
+        when exporting large result sets.  For instance::
+
+            query = session.query(Account).order_by(Account.email)
+            for appstruct in schema.iter_dictify(query, chunk_size=500):
+                writer.writerow(appstruct)
+
+        Arguments/Keywords
+
+        source
+            A :class:`sqlalchemy.orm.Query`, which is then loaded with
+            :meth:`~sqlalchemy.orm.Query.yield_per`, a ``Result`` of a
+            ``select()`` of the mapped class, which is read with its
+            ``partitions()`` method, or any other iterable of objects.
+            Use the ``yield_per`` execution option for results to be
+            streamed from the database as well.
+        chunk_size
+            The number of objects loaded and dictified at a time.
+            Default: 1000.
+        chunks
+            If ``True``, yield lists of up to ``chunk_size`` appstructs
+            rather than single appstructs.  Default: ``False``.
+        expunge
+            If ``True``, objects are expunged from their session once
+            dictified, together with the related objects dictified with
+            them, so that the identity map does not grow with the number
+            of objects.  Objects with pending changes are never expunged.
+            Default: ``True``.
+        memo
+            If ``True``, objects reached several times within a chunk are
+            dictified once; see :meth:`dictify`.  Default: ``False``.
+        """
+        if hasattr(source, 'partitions'):
+            if hasattr(source, 'scalars'):
+                source = source.scalars()
+            batches = source.partitions(chunk_size)
+        else:
+            if hasattr(source, 'yield_per'):
+                source = source.yield_per(chunk_size)
+            batches = _chunks(source, chunk_size)
+
+        plan = self._check_dictify_plans()
+        dictify = self._dictify
+        for objs in batches:
+            chunk_memo = {} if memo else None
+            appstructs = [dictify(obj, plan, chunk_memo) for obj in objs]
+            if expunge:
+                self._expunge(objs)
+            if chunks:
+                yield appstructs
+            else:
+                for appstruct in appstructs:
+                    yield appstruct
+
+    def _expunge(self, objs):
+        """ Expunge ``objs`` and the related objects loaded through the
+        relationships of this schema from their sessions.
+        """
+        seen = set()
+        pending = [(self, objs)]
+        while pending:
+            schema, objs = pending.pop()
+            relationships = [(name, kind, target)
+                             for name, kind, node, target, none, fields,
+                             depth
+                             in schema._get_dictify_plan()
+                             if kind is not _COLUMN]
+            for obj in objs:
+                state = inspect(obj, raiseerr=False)
+                if state is None or id(state) in seen:
+                    continue
+                seen.add(id(state))
+                if not state.modified and state.key is not None:
+                    session = object_session(obj)
+                    if session is not None:
+                        session.expunge(obj)
+                for name, kind, target in relationships:
+                    # Only follow relationships which were loaded.
+                    value = state.dict.get(name)
+                    if value is None:
+                        continue
+                    if kind is _COLLECTION:
+                        pending.append((target, value))
+                    else:
+                        pending.append((target, [value]))
+
+    def get_loader_options(self, collection_strategy='selectin',
+                           scalar_strategy='joined', exclude_strategy=None):
+        """ Return query options loading what :meth:`dictify` reads.
+
+        The options eagerly load the relationships mapped by this schema,
+        recursively, and only load the columns mapped by each schema, so
+        that dictifying the results of a query takes a fixed number of
+        round trips instead of one per object and relationship::
+
+            query = session.query(Account).options(
+                *schema.get_loader_options())
+            appstructs = schema.dictify_many(query)
+
+        Primary keys and the columns needed to load the relationships are
+        always loaded.
+
+        Arguments/Keywords
+
+        collection_strategy
+            The loader strategy of one-to-many and many-to-many
+            relationships, named as the ``lazy`` argument of
+            :func:`sqlalchemy.orm.relationship`: ``'select'``,
+            ``'joined'``, ``'subquery'``, ``'selectin'``, ``'immediate'``,
+            ``'noload'`` or ``'raise'``.  Default: ``'selectin'``.
+        scalar_strategy
+            The loader strategy of many-to-one and one-to-one
+            relationships.  Default: ``'joined'``.
+        exclude_strategy
+            The loader strategy of relationships which are not mapped by
+            the schema, typically ``'noload'`` or ``'raise'``.
+            Default: ``None``, which leaves their strategy unchanged.
+        """
+        strategies = (collection_strategy, scalar_strategy, exclude_strategy)
+        for strategy in strategies:
+            if strategy is not None and not hasattr(orm,
+                                                    _loaders.get(strategy,
+                                                                 '')):
+                raise ValueError('Unknown loader strategy: %s' % strategy)
+        return self._loader_options(None, None, strategies)
+
+    def _loader_options(self, parent, parent_prop, strategies):
+        """ Return the loader options of this schema, chained to the
+        loader ``parent`` of the relationship ``parent_prop`` it maps, if
+        any.
+        """
+        collection_strategy, scalar_strategy, exclude_strategy = strategies
+
+        def loader(strategy, attr):
+            if parent is None:
+                return getattr(orm, _loaders[strategy])(attr)
+            return getattr(parent, _loaders[strategy])(attr)
+
+        mapper = self.inspector
+        class_ = self.class_
+        # The columns of this class referring to the parent are used to
+        # populate collections.
+        columns = _column_keys(mapper, getattr(parent_prop, 'remote_side',
+                                               ()))
+        options = []
+        included = set()
+        for (name, kind, node, target, none, fields,
+             depth) in self._get_dictify_plan():
+            if kind is _COLUMN:
+                columns.add(name)
+                continue
+            prop = mapper.relationships[name]
+            included.add(name)
+            # The columns of this class used to load the relationship.
+            columns.update(_column_keys(mapper, prop.local_columns))
+            strategy = collection_strategy if prop.uselist else scalar_strategy
+            options.extend(target._loader_options(
+                loader(strategy, getattr(class_, name)), prop, strategies))
+
+        attrs = [getattr(class_, name) for name in sorted(columns)]
+        if parent is None:
+            options.insert(0, orm.load_only(*attrs))
+        else:
+            options.insert(0, parent.load_only(*attrs))
+
+        if exclude_strategy is not None:
+            for prop in mapper.relationships:
+                if prop.key not in included:
+                    options.append(loader(exclude_strategy,
+                                          getattr(class_, prop.key)))
+        return options
+
+    def get_select(self):
+        """ Return a ``select()`` of the columns mapped by this schema.
+
+        Columns of many-to-one and one-to-one relationships are selected
+        through outer joins, so that the rows of the statement are turned
+        into appstructs by :meth:`dictify_rows` without loading any ORM
+        instance.  Collections are loaded by :meth:`dictify_rows` with one
+        more query per collection relationship.  The statement can be
+        refined, for instance with ``where()`` or ``limit()``, as long as
+        its columns are kept::
+
+            statement = schema.get_select().where(Account.enabled)
+            rows = session.execute(statement)
+            appstructs = schema.dictify_rows(rows, session)
+
+        Columns are labelled arbitrarily; use :meth:`dictify_rows` rather
+        than relying on their names.  Requires SQLAlchemy 1.4 or later.
+        """
+        return self._get_projection().statement
+
+    def dictify_rows(self, rows, bind=None):
+        """ Return the appstructs of ``rows`` of a :meth:`get_select`
+        statement.
+
+        The appstructs are those which :meth:`dictify` returns for the
+        corresponding objects, except that collections are ordered by the
+        ``order_by`` of their relationship, or by primary key.
+
+        Arguments/Keywords
+
+        rows
+            An iterable of rows, such as the result of executing the
+            statement returned by :meth:`get_select`.
+        bind
+            The session or connection used to load collections, with one
+            query per collection relationship and batch of 500 rows.
+            Required if the schema maps collections.
+        """
+        return self._get_projection().dictify(
+            [getattr(row, '_mapping', row) for row in rows], bind)
+
+    def to_cstruct(self, obj):
+        """ Return the cstruct of ``obj``.
+
+        This returns the same cstruct as
+        ``self.serialize(self.dictify(obj))``, but reads the attributes of
+        ``obj`` and serializes them in a single pass, without building an
+        intermediate appstruct.  If serialization fails, the two steps are
+        run instead so that the very same :exc:`colander.Invalid` error is
+        raised.
+
+        Arguments/Keywords
+
+        obj
+            An object instance to be serialized, as accepted by
+            :meth:`dictify`.
+        """
+        self._check_dictify_plans()
+        try:
+            return self._to_cstruct(obj, self._get_cstruct_plan(False))
+        except colander.Invalid:
+            # Reproduce the error of the two step path.
+            return self.serialize(self.dictify(obj))
+
+    def to_cstruct_many(self, objs):
+        """ Return a list of the cstructs of ``objs``.
+
+        This is equivalent to calling :meth:`to_cstruct` for each object of
+        the iterable ``objs``.
+        """
+        self._check_dictify_plans()
+        plan = self._get_cstruct_plan(False)
+        to_cstruct = self._to_cstruct
+        cstructs = []
+        for obj in objs:
             try:
-                getattr(self.inspector.column_attrs, name)
-                value = getattr(obj, name)
-
-            except AttributeError:
-                try:
-                    prop = getattr(self.inspector.relationships, name)
-                    if prop.uselist:
-                        value = [self[name].children[0].dictify(o)
-                                 for o in getattr(obj, name)]
+                cstructs.append(to_cstruct(obj, plan))
+            except colander.Invalid:
+                # Reproduce the error of the two step path.
+                cstructs.append(self.serialize(self.dictify(obj)))
+        return cstructs
+
+    def _to_cstruct(self, obj, plan):
+        # Follows colander.Mapping._impl for the appstruct returned by
+        # dictify(obj), and raises the first error instead of collecting
+        # them.
+        cstruct = {}
+        for name, kind, node, target, none, serialize in plan:
+            if kind is None:
+                value = colander.null
+            else:
+                value = getattr(obj, name, _missing)
+                if value is _missing:
+                    value = colander.null
+                elif value is None:
+                    value = none
+                elif kind is _COLUMN:
+                    pass
+                elif not serialize:
+                    if kind is _COLLECTION:
+                        value = target._dictify_many(value, None)
                     else:
-                        o = getattr(obj, name)
-                        value = None if o is None else self[name].dictify(o)
-                except AttributeError:
-                    # The given node isn't part of the SQLAlchemy model
-                    msg = 'SQLAlchemySchemaNode.dictify: %s not found on %s'
-                    log.debug(msg, name, self)
+                        value = target._dictify(
+                            value, target._get_dictify_plan(names=False),
+                            None)
+                elif kind is _COLLECTION:
+                    plan_ = target._get_cstruct_plan(False)
+                    cstruct[name] = [target._to_cstruct(o, plan_)
+                                     for o in value]
                     continue
-
-            # SQLAlchemy mostly converts values into Python types
-            #  appropriate for appstructs, but not always.  The biggest
-            #  problems are around `None` values so we're dealing with
-            #  those here.  All types should accept `colander.null` so
-            #  we mostly change `None` into that.
-
-            if value is None:
-                if isinstance(node.typ, colander.String):
-                    # colander has an issue with `None` on a String type
-                    #  where it translates it into "None".  Let's check
-                    #  for that specific case and turn it into a
-                    #  `colander.null`.
-                    dict_[name] = colander.null
                 else:
-                    # A specific case this helps is with Integer where
-                    #  `None` is an invalid value.  We call serialize()
-                    #  to test if we have a value that will work later
-                    #  for serialization and then allow it if it doesn't
-                    #  raise an exception.  Hopefully this also catches
-                    #  issues with user defined types and future issues.
-                    try:
-                        node.serialize(value)
-                    except:
-                        dict_[name] = colander.null
-                    else:
-                        dict_[name] = value
+                    cstruct[name] = target._to_cstruct(
+                        value, target._get_cstruct_plan(False))
+                    continue
+
+            if value is colander.null:
+                if node.default is drop:
+                    continue
+                result = node.serialize(value)
+            elif kind is _COLUMN and serialize is not None:
+                result = serialize(node, value)
+            else:
+                result = node.serialize(value)
+            if result is not drop:
+                cstruct[name] = result
+        return cstruct
+
+    def _get_projection(self):
+        projection = self.__dict__.get('_projection')
+        if projection is None or projection.plan is not \
+                self._get_dictify_plan():
+            projection = self._projection = _Projection(self)
+        return projection
+
+    def _dictify(self, obj, plan, memo=None):
+        if memo is not None:
+            state = inspect(obj, raiseerr=False)
+            # Plans differ for each schema and selection of fields.
+            if state is not None and state.key is not None:
+                key = (id(plan), state.key)
             else:
-                dict_[name] = value
+                key = (id(plan), id(obj))
+            cached = memo.get(key)
+            if cached is not None:
+                return cached[1]
 
+        dict_ = {}
+        for name, kind, node, target, none, fields, depth in plan:
+
+            value = getattr(obj, name, _missing)
+            if value is _missing:
+                continue
+            elif kind is _COLLECTION:
+                value = target._dictify_many(value, memo, fields, depth)
+            elif kind is _SCALAR and value is not None:
+                value = target._dictify(
+                    value, target._get_dictify_plan(fields, depth, False),
+                    memo)
+
+            dict_[name] = none if value is None else value
+
+        if memo is not None:
+            # Keep obj alive, otherwise its id could be reused by another
+            # object dictified later on.
+            memo[key] = (obj, dict_)
         return dict_
 
-    def objectify(self, dict_, context=None):
+    def _get_dictify_plan(self, fields=None, max_depth=None, names=True):
+        """ Return the plan followed by :meth:`dictify`.
+
+        The plan is a list of ``(name, kind, node, target, none, fields,
+        depth)`` tuples, one for each child node mapping a column or a
+        relationship, where ``target`` is the schema dictifying related
+        objects, ``none`` the appstruct value of ``None`` for the node and
+        ``fields`` and ``depth`` the selection applied to related objects.
+        It is built on first use and rebuilt when the child nodes change or
+        are renamed.
+
+        ``fields`` is a selection parsed by :func:`_parse_fields`; plans
+        for a selection of fields or a maximum depth are derived from the
+        complete plan and cached as well.
+
+        Checking whether child nodes were renamed is skipped if ``names``
+        is false: plans followed for each related object are checked once
+        by :meth:`_check_dictify_plans` instead.
+        """
+        children = self.children
+        plan = self.__dict__.get('_dictify_plan')
+        if (plan is None or plan[0] is not children
+                or plan[1] != len(children)
+                or names and plan[5] != list(map(_node_name, children))):
+            # The child nodes were changed, or renamed.
+            plan = self._build_dictify_plan()
+        if fields is None and max_depth is None:
+            return plan[2]
+
+        selected = plan[3]
+        key = (fields, max_depth)
+        entries = selected.get(key)
+        if entries is not None:
+            return entries
+        selection = None if fields is None else dict(fields)
+        depth = None if max_depth is None else max_depth - 1
+        entries = []
+        for entry in plan[2]:
+            name, kind = entry[:2]
+            if selection is not None and name not in selection:
+                continue
+            if kind is not _COLUMN:
+                if depth is not None and depth < 0:
+                    continue
+                sub = None if selection is None else selection[name]
+                entry = entry[:5] + (sub, depth)
+            entries.append(entry)
+        if len(selected) >= _max_selections:
+            selected.clear()
+        selected[key] = entries
+        return entries
+
+    def _check_dictify_plans(self, fields=None, max_depth=None):
+        """ Return the plan followed by :meth:`dictify`, after checking
+        whether the child nodes of this schema, and of the schemas of
+        related objects it reaches, were renamed.
+
+        This is done once by each method dictifying objects, so that the
+        plans of related objects do not check it for every object.
+        """
+        seen = set()
+        pending = [(self, fields, max_depth)]
+        while pending:
+            schema, selection, depth = pending.pop()
+            key = (id(schema), selection, depth)
+            if key in seen:
+                continue
+            seen.add(key)
+            for entry in schema._get_dictify_plan(selection, depth):
+                if entry[1] is not _COLUMN:
+                    pending.append((entry[3], entry[5], entry[6]))
+        return self._get_dictify_plan(fields, max_depth, False)
+
+    def _build_dictify_plan(self):
+        children = self.children
+
+        entries = []
+        # The plan followed by to_cstruct, for every child node.
+        cstruct_entries = []
+        column_attrs = self.inspector.column_attrs
+        relationships = self.inspector.relationships
+        for node in children:
+            name = node.name
+            # Serialize non-null values with the type directly, unless the
+            # node customises serialize().
+            if type(node).serialize == SchemaNode.serialize:
+                serialize = node.typ.serialize
+            else:
+                serialize = None
+            if name in column_attrs:
+                none = _none_value(node)
+                entries.append((name, _COLUMN, node, None, none, None, None))
+                cstruct_entries.append((name, _COLUMN, node, None, none,
+                                        serialize))
+                continue
+            prop = relationships.get(name)
+            if prop is not None:
+                kind = _COLLECTION if prop.uselist else _SCALAR
+                target = node
+                if prop.uselist:
+                    target = node.children[0] if node.children else None
+                if hasattr(target, '_dictify'):
+                    none = None if prop.uselist else _none_value(node)
+                    entries.append((name, kind, node, target, none, None,
+                                    None))
+                    # Related objects are serialized in the same pass when
+                    # their nodes use the standard Colander types.
+                    typ = Sequence if prop.uselist else Mapping
+                    fused = (serialize is not None and type(node.typ) is typ
+                             and type(target).serialize == SchemaNode.serialize
+                             and type(target.typ) is Mapping)
+                    cstruct_entries.append((name, kind, node, target, none,
+                                            fused))
+                    continue
+            # The given node isn't part of the SQLAlchemy model, or is a
+            # relationship whose nodes were overridden.
+            msg = 'SQLAlchemySchemaNode.dictify: %s not found on %s'
+            log.debug(msg, name, self)
+            cstruct_entries.append((name, None, node, None, None, None))
+
+        plan = self._dictify_plan = (children, len(children), entries, {},
+                                     cstruct_entries,
+                                     list(map(_node_name, children)))
+        return plan
+
+    def _get_cstruct_plan(self, names=True):
+        """ Return the plan followed by :meth:`to_cstruct`.
+
+        The plan is a list of ``(name, kind, node, target, none,
+        serialize)`` tuples, one for each child node, where ``kind`` is
+        ``None`` for nodes which are not dictified.  For columns,
+        ``serialize`` is the ``serialize`` method of the type of the node,
+        or ``None`` if the node must be serialized through its own
+        ``serialize`` method.  For relationships, it tells whether related
+        objects are serialized in the same pass.  ``names`` is passed to
+        :meth:`_get_dictify_plan`.
+        """
+        self._get_dictify_plan(names=names)
+        return self._dictify_plan[4]
+
+    def objectify(self, dict_, context=None, session=None):
         """ Return an object representing ``dict_`` using schema information.
 
         The schema will be used to choose how the data in the structure
@@ -681,30 +1652,43 @@ class SQLAlchemySchemaNode(colander.SchemaNode):
 
             Default: ``None``.  Defaults to instantiating a new instance of the
             mapped class associated with this schema.
+        session
+            Optional :class:`sqlalchemy.orm.Session`.  If supplied, the
+            dicts of ``dict_`` (and ``dict_`` itself, unless ``context`` is
+            given) which contain a full primary key are applied to the
+            matching instance in the database, if any, instead of a new
+            instance.  Instances are looked up in the identity map of the
+            session first, then with one ``IN`` query per mapped class.
+            Default: ``None``.
         """
-        mapper = self.inspector
-        context = mapper.class_() if context is None else context
+        resolved = None
+        if session is not None:
+            resolved = self._resolve(session, [dict_], context is None)
+        return self._objectify(dict_, context, resolved)
+
+    def objectify_many(self, dicts, session=None):
+        """ Return a list of objects representing ``dicts``.
+
+        This is equivalent to calling :meth:`objectify` for each dict, but
+        when ``session`` is supplied, the existing instances of every dict
+        are fetched together, with one ``IN`` query per mapped class.
+        """
+        dicts = list(dicts)
+        resolved = None
+        if session is not None:
+            resolved = self._resolve(session, dicts, True)
+        objectify = self._objectify
+        return [objectify(dict_, None, resolved) for dict_ in dicts]
+
+    def _objectify(self, dict_, context, resolved):
+        plan = self._get_objectify_plan()
+        if context is None and resolved:
+            context = resolved.get((self.inspector,
+                                    self._get_identity(dict_)))
+        context = self.inspector.class_() if context is None else context
         for attr in dict_:
-            if mapper.has_property(attr):
-                prop = mapper.get_property(attr)
-                if hasattr(prop, 'mapper'):
-                    cls = prop.mapper.class_
-                    if prop.uselist:
-                        # Sequence of objects
-                        value = [self[attr].children[0].objectify(obj)
-                                 for obj in dict_[attr]]
-                    else:
-                        # Single object
-                        value = self[attr].objectify(dict_[attr])
-                else:
-                     value = dict_[attr]
-                     if value is colander.null:
-                         # `colander.null` is never an appropriate
-                         #  value to be placed on an SQLAlchemy object
-                         #  so we translate it into `None`.
-                         value = None
-                setattr(context, attr, value)
-            else:
+            kind = plan.get(attr)
+            if kind is None:
                 # Ignore attributes if they are not mapped
                 log.debug(
                     'SQLAlchemySchemaNode.objectify: %s not found on '
@@ -712,16 +1696,522 @@ class SQLAlchemySchemaNode(colander.SchemaNode):
                     attr, self
                 )
                 continue
+            value = dict_[attr]
+            if kind is _COLUMN:
+                if value is colander.null:
+                    # `colander.null` is never an appropriate
+                    #  value to be placed on an SQLAlchemy object
+                    #  so we translate it into `None`.
+                    value = None
+            elif kind is _COLLECTION:
+                # Sequence of objects
+                objectify = self[attr].children[0]._objectify
+                value = [objectify(obj, None, resolved) for obj in value]
+            else:
+                # Single object
+                value = self[attr]._objectify(value, None, resolved)
+            setattr(context, attr, value)
 
         return context
 
+    def objectify_changes(self, dict_, context, session=None):
+        """ Apply ``dict_`` to ``context``, only assigning the values which
+        differ from the current ones, and return the paths of the changes.
+
+        Unlike :meth:`objectify`, which sets every attribute found in
+        ``dict_``, this compares each value with the current value of the
+        attribute, loading it if needed, and leaves equal values alone, so
+        that flushing only updates the modified columns, if any.  Nested
+        dicts are applied to the related objects having the same primary
+        key; a dict of a many-to-one relationship without a primary key is
+        applied to the current related object.  Other nested dicts give new
+        objects, as with :meth:`objectify`.
+
+        The paths returned are dotted attribute names, such as ``name`` or
+        ``person.name``.  Items of collections are designated by their
+        index in the new collection, as in ``addresses.0.city``, and a
+        collection or many-to-one relationship which was assigned a
+        different object, or list of objects, is returned by its name.  An
+        empty set means nothing changed.
+
+        Arguments/Keywords
+
+        dict\_
+            The data to apply, as accepted by :meth:`objectify`.
+        context
+            The object to update.
+        session
+            Optional :class:`sqlalchemy.orm.Session` used to find the
+            existing instances matching nested dicts which are not related
+            to ``context`` yet; see :meth:`objectify`.
+        """
+        resolved = None
+        if session is not None:
+            resolved = self._resolve(session, [dict_], False)
+        changes = set()
+        self._update(dict_, context, resolved, changes, '')
+        return changes
+
+    def _update(self, dict_, context, resolved, changes, prefix):
+        plan = self._get_objectify_plan()
+        for attr in dict_:
+            kind = plan.get(attr)
+            if kind is None:
+                log.debug(
+                    'SQLAlchemySchemaNode.objectify_changes: %s not found '
+                    'on %s. This property has been ignored.',
+                    attr, self
+                )
+                continue
+            value = dict_[attr]
+            current = getattr(context, attr, None)
+            if kind is _COLUMN:
+                if value is colander.null:
+                    value = None
+                if current == value:
+                    continue
+            elif kind is _COLLECTION:
+                target = self[attr].children[0]
+                current = current if current is not None else []
+                objs = dict((inspect(obj).identity, obj) for obj in current)
+                objs.pop(None, None)
+                value = [target._match(obj, objs, resolved, changes,
+                                       '%s%s.%d.' % (prefix, attr, i))
+                         for i, obj in enumerate(value)]
+                if len(value) == len(current) and all(
+                        obj is old for obj, old in zip(value, current)):
+                    continue
+            elif value is None or value is colander.null:
+                if current is None:
+                    continue
+                value = None
+            else:
+                objs = {}
+                if current is not None:
+                    objs[None] = objs[inspect(current).identity] = current
+                value = self[attr]._match(value, objs, resolved, changes,
+                                          prefix + attr + '.')
+                if value is current:
+                    continue
+            setattr(context, attr, value)
+            changes.add(prefix + attr)
+
+    def _match(self, dict_, objs, resolved, changes, prefix):
+        """ Return the object of ``objs``, by primary key, or of
+        ``resolved`` matching ``dict_``, updated with ``dict_``, or a new
+        object if there is none.
+        """
+        identity = self._get_identity(dict_)
+        obj = objs.get(identity)
+        if obj is None and resolved and identity is not None:
+            obj = resolved.get((self.inspector, identity))
+        if obj is None:
+            return self._objectify(dict_, None, resolved)
+        self._update(dict_, obj, resolved, changes, prefix)
+        return obj
+
+    def bulk_insert(self, bind, appstructs, batch_size=_batch_size):
+        """ Insert the objects described by ``appstructs`` without building
+        ORM instances.
+
+        This has the same effect as adding the objects returned by
+        :meth:`objectify` for each appstruct to a session and flushing
+        it, but inserts rows with ``executemany`` Core ``INSERT``
+        statements, ``batch_size`` appstructs at a time.  Appstructs
+        should be validated by :meth:`deserialize` first.  Rows are
+        grouped by the set of columns they provide, so that columns left
+        out of an appstruct still get their default.
+
+        Objects of one-to-many relationships are inserted after their
+        parents, with their foreign keys set from the primary keys of the
+        parents.  When the database generates those keys, they are fetched
+        with ``RETURNING`` if the dialect supports it with
+        ``executemany`` and returns the rows in the order of the parameters,
+        and otherwise by inserting the parents having children one at a
+        time.  Many-to-one and many-to-many relationships
+        are not supported: set foreign key columns instead.
+
+        Arguments/Keywords
+
+        bind
+            A :class:`sqlalchemy.orm.Session` or
+            :class:`sqlalchemy.engine.Connection`.  Objects pending in a
+            session are not flushed first.
+        appstructs
+            An iterable of appstructs, as accepted by :meth:`objectify`.
+        batch_size
+            The number of appstructs inserted per batch.  Default: 500.
+        """
+        if isinstance(bind, Session):
+            bind = bind.connection(
+                bind_arguments={'mapper': self.inspector})
+        for batch in _chunks(appstructs, batch_size):
+            self._bulk_insert(bind, batch)
+
+    def _bulk_insert(self, connection, appstructs, foreign_keys=None):
+        table, columns, relations, keys, identity = \
+            self._get_insert_plan()[1:]
+        rows = []
+        children = []
+        for i, appstruct in enumerate(appstructs):
+            row = dict(identity)
+            if foreign_keys is not None:
+                row.update(foreign_keys[i])
+            for name, key in columns:
+                if name in appstruct:
+                    value = appstruct[name]
+                    if value is colander.null:
+                        value = None
+                    if value is None and key in keys:
+                        # Let the database generate the primary key.
+                        continue
+                    row[key] = value
+            for name, target, pairs in relations:
+                value = appstruct.get(name)
+                if value:
+                    if pairs is None:
+                        raise NotImplementedError(
+                            'SQLAlchemySchemaNode.bulk_insert: %s is not a '
+                            'one-to-many relationship' % name)
+                    children.append((row, target, pairs, value))
+            rows.append(row)
+
+        # Rows whose primary key is needed by their children.
+        parents = set(id(row) for row, target, pairs, value in children
+                      if any(local not in row for local, remote in pairs))
+        groups = collections.OrderedDict()
+        for row in rows:
+            key = (id(row) in parents, tuple(sorted(row)))
+            groups.setdefault(key, []).append(row)
+        # The rows returned by an executemany are only known to be in the
+        # order of the parameters when requested, from SQLAlchemy 2.0.
+        returning = getattr(
+            connection.dialect,
+            'insert_executemany_returning_sort_by_parameter_order', False)
+        for (fetch, _), group in groups.items():
+            statement = table.insert()
+            if not fetch:
+                connection.execute(statement, group)
+            elif returning and len(group) > 1:
+                statement = statement.returning(
+                    *keys.values(), sort_by_parameter_order=True)
+                result = connection.execute(statement, group)
+                for row, values in zip(group, result):
+                    row.update(zip(keys, values))
+            else:
+                for row in group:
+                    values = connection.execute(
+                        statement, row).inserted_primary_key
+                    row.update(zip(keys, values))
+
+        related = collections.OrderedDict()
+        for row, target, pairs, value in children:
+            appstructs, foreign_keys = related.setdefault(target, ([], []))
+            for child in value:
+                if any(local not in row for local, remote in pairs):
+                    raise ValueError(
+                        'SQLAlchemySchemaNode.bulk_insert: the keys of %s '
+                        'are not known' % self)
+                appstructs.append(child)
+                foreign_keys.append(dict((remote, row[local])
+                                         for local, remote in pairs))
+        for target, (appstructs, foreign_keys) in related.items():
+            target._bulk_insert(connection, appstructs, foreign_keys)
+
+    def _get_insert_plan(self):
+        """ Return the plan followed by :meth:`bulk_insert`.
+
+        The plan is a tuple of the dictify plan it is built from, the
+        table, the ``(name, key)`` pairs of the columns, the ``(name,
+        target, pairs)`` tuples of the relationships, the primary key columns
+        by key and the polymorphic identity, as ``(key, value)`` pairs.
+        ``pairs`` maps the keys of the columns of the parent to those of
+        the children, or is ``None`` for other relationships, which are not
+        supported.
+        """
+        dictify_plan = self._get_dictify_plan()
+        plan = self.__dict__.get('_insert_plan')
+        if plan is not None and plan[0] is dictify_plan:
+            return plan
+
+        mapper = self.inspector
+        if len(mapper.tables) != 1:
+            raise NotImplementedError(
+                'SQLAlchemySchemaNode.bulk_insert: %s is mapped to several '
+                'tables' % mapper.class_)
+        columns = []
+        relations = []
+        for name, kind, node, target, none, fields, depth in dictify_plan:
+            prop = mapper.get_property(name)
+            if kind is _COLUMN:
+                columns.append((name, prop.columns[0].key))
+            elif kind is _SCALAR or prop.secondary is not None:
+                relations.append((name, target, None))
+            else:
+                relations.append((name, target,
+                                  [(local.key, remote.key) for local, remote
+                                   in prop.local_remote_pairs]))
+        keys = collections.OrderedDict(
+            (column.key, column) for column in mapper.primary_key)
+        identity = []
+        if mapper.polymorphic_identity is not None and \
+                isinstance(mapper.polymorphic_on, Column):
+            identity.append((mapper.polymorphic_on.key,
+                             mapper.polymorphic_identity))
+        plan = self._insert_plan = (dictify_plan, mapper.local_table,
+                                    columns, relations, keys, identity)
+        return plan
+
+    def _get_objectify_plan(self):
+        """ Map the name of each property of the mapped class to the way
+        :meth:`objectify` sets it: ``'column'`` for values set as they are,
+        ``'scalar'`` and ``'collection'`` for relationships.
+        """
+        plan = self.__dict__.get('_objectify_plan')
+        if plan is not None:
+            return plan
+        plan = {}
+        for prop in self.inspector.attrs:
+            if not hasattr(prop, 'mapper'):
+                plan[prop.key] = _COLUMN
+            elif prop.uselist:
+                plan[prop.key] = _COLLECTION
+            else:
+                plan[prop.key] = _SCALAR
+        self._objectify_plan = plan
+        return plan
+
+    def _get_identity(self, dict_):
+        """ Return the primary key found in ``dict_``, or ``None`` if it
+        is not complete.
+        """
+        names = self.__dict__.get('_identity_names')
+        if names is None:
+            mapper = self.inspector
+            names = self._identity_names = [
+                mapper.get_property_by_column(column).key
+                for column in mapper.primary_key]
+        identity = tuple(dict_.get(name) for name in names)
+        for value in identity:
+            if value is None or value is colander.null:
+                return None
+        return identity
+
+    def _collect_identities(self, dict_, identities, root):
+        """ Add the primary keys found in ``dict_`` and its nested dicts
+        to ``identities``, a dict of sets by mapper.
+        """
+        if root:
+            identity = self._get_identity(dict_)
+            if identity is not None:
+                identities.setdefault(self.inspector, set()).add(identity)
+        plan = self._get_objectify_plan()
+        for attr in dict_:
+            kind = plan.get(attr)
+            value = dict_[attr]
+            if kind is _COLLECTION and value:
+                target = self[attr].children[0]
+                for obj in value:
+                    target._collect_identities(obj, identities, True)
+            elif kind is _SCALAR and value:
+                self[attr]._collect_identities(value, identities, True)
+
+    def _resolve(self, session, dicts, root):
+        """ Return the instances matching the primary keys found in
+        ``dicts``, by ``(mapper, primary key)``.  The primary keys of
+        ``dicts`` themselves are only considered if ``root`` is ``True``.
+        """
+        identities = {}
+        for dict_ in dicts:
+            self._collect_identities(dict_, identities, root)
+        resolved = {}
+        for mapper, keys in identities.items():
+            missing = []
+            for key in keys:
+                obj = session.identity_map.get(
+                    mapper.identity_key_from_primary_key(list(key)))
+                if obj is not None:
+                    resolved[(mapper, key)] = obj
+                else:
+                    missing.append(key)
+            if len(mapper.primary_key) == 1:
+                column = mapper.primary_key[0]
+                missing = [key[0] for key in missing]
+            else:
+                column = tuple_(*mapper.primary_key)
+            for chunk in _chunks(missing, _batch_size):
+                query = session.query(mapper).filter(column.in_(chunk))
+                for obj in query:
+                    key = tuple(mapper.primary_key_from_instance(obj))
+                    resolved[(mapper, key)] = obj
+        return resolved
+
     def clone(self):
-        cloned = self.__class__(self.class_,
-                                self.includes,
-                                self.excludes,
-                                self.overrides,
-                                self.unknown,
-                                **self.kwargs)
-        cloned.__dict__.update(self.__dict__)
-        cloned.children = [node.clone() for node in self.children]
+        """ Clone the schema node and return the clone.
+
+        All subnodes are also cloned recursively.  Cloning copies the
+        existing nodes and does not inspect the mapped class again; the
+        nodes of a lazy schema which are not built yet are built
+        independently by the clone when first needed.
+        """
+        state = self.__dict__.copy()
+        cloned = self.__class__.__new__(self.__class__)
+        cloned.__dict__.update(state)
+        cloned._forget_children()
+        if '_lazy_nodes' in state or '_node_source' in state:
+            del cloned.children
+        else:
+            cloned.children = [node.clone() for node in self.children]
         return cloned
+
+
+class _Projection(object):
+    """ The columns selected by :meth:`SQLAlchemySchemaNode.get_select`.
+
+    Each column is labelled with its position in the statement; nested
+    projections of scalar relationships select their columns in the
+    statement of their parent.
+    """
+
+    def __init__(self, schema, entity=None, parent=None):
+        self.schema = schema
+        self.plan = schema._get_dictify_plan()
+        mapper = schema.inspector
+        entity = schema.class_ if entity is None else entity
+        self._entity = entity
+        if parent is None:
+            self._columns = []
+            self._labels = {}
+        else:
+            self._columns = parent._columns
+            self._labels = parent._labels
+
+        self.keys = [self._select(mapper.get_property_by_column(column).key)
+                     for column in mapper.primary_key]
+        self.columns = []
+        self.scalars = []
+        self.collections = []
+        self.joins = []
+        for name, kind, node, target, none, fields, depth in self.plan:
+            if kind is _COLUMN:
+                self.columns.append((name, none, self._select(name)))
+                continue
+            prop = mapper.relationships[name]
+            if kind is _SCALAR:
+                alias = orm.aliased(prop.mapper.class_)
+                onclause = getattr(entity, name).of_type(alias)
+                self.joins.append((alias, onclause))
+                self.scalars.append((name, none,
+                                     _Projection(target, alias, self)))
+                continue
+            pairs = [(local, remote)
+                     for local, remote in prop.local_remote_pairs
+                     if local in prop.local_columns]
+            local = [self._select(mapper.get_property_by_column(column).key)
+                     for column, remote in pairs]
+            self.collections.append((name, node, target, prop, local,
+                                     [remote for column, remote in pairs]))
+
+        if parent is None:
+            statement = select(*self._columns)
+            for alias, onclause in self._joins():
+                statement = statement.outerjoin(alias, onclause)
+            self.statement = statement
+
+    def _select(self, key):
+        """ Select the attribute ``key`` and return its label. """
+        label = self._labels.get((self._entity, key))
+        if label is None:
+            label = 'c%d' % len(self._columns)
+            self._columns.append(getattr(self._entity, key).label(label))
+            self._labels[self._entity, key] = label
+        return label
+
+    def _joins(self):
+        for alias, onclause in self.joins:
+            yield alias, onclause
+        for name, none, projection in self.scalars:
+            for join in projection._joins():
+                yield join
+
+    def dictify(self, rows, bind):
+        dicts = [self._dictify(row) for row in rows]
+        self._load_collections(dicts, rows, bind)
+        return dicts
+
+    def _dictify(self, row):
+        dict_ = {}
+        for name, none, label in self.columns:
+            value = row[label]
+            dict_[name] = none if value is None else value
+        for name, none, projection in self.scalars:
+            if all(row[label] is None for label in projection.keys):
+                dict_[name] = none
+            else:
+                dict_[name] = projection._dictify(row)
+        return dict_
+
+    def _load_collections(self, dicts, rows, bind):
+        for name, node, target, prop, local, remote in self.collections:
+            if bind is None:
+                raise ValueError('A session or connection is required to '
+                                 'load %s' % prop)
+            keys = [tuple(row[label] for label in local) for row in rows]
+            collections = target._get_projection().load(
+                prop, remote, set(key for key in keys if None not in key),
+                bind)
+            for dict_, key in zip(dicts, keys):
+                dict_[name] = collections.get(key, [])
+
+        for name, none, projection in self.scalars:
+            pairs = [(dict_[name], row) for dict_, row in zip(dicts, rows)
+                     if isinstance(dict_[name], dict)]
+            if pairs:
+                projection._load_collections([pair[0] for pair in pairs],
+                                             [pair[1] for pair in pairs],
+                                             bind)
+
+    def load(self, prop, remote, keys, bind):
+        """ Return the appstructs of the collections ``prop`` of the parents
+        whose local columns have the values ``keys``, grouped by key.
+        """
+        mapper = self.schema.inspector
+        columns = list(self._columns)
+        labels = []
+        for column in remote:
+            if prop.secondary is None:
+                column = getattr(self.schema.class_,
+                                 mapper.get_property_by_column(column).key)
+            labels.append('c%d' % len(columns))
+            columns.append(column.label(labels[-1]))
+
+        statement = select(*columns)
+        if prop.secondary is not None:
+            statement = statement.join(prop.secondary, prop.secondaryjoin)
+        for alias, onclause in self._joins():
+            statement = statement.outerjoin(alias, onclause)
+        if prop.order_by:
+            statement = statement.order_by(*prop.order_by)
+        else:
+            statement = statement.order_by(*mapper.primary_key)
+
+        if len(remote) == 1:
+            criterion = columns[-1].element.in_
+        else:
+            criterion = tuple_(*[column.element
+                                 for column in columns[-len(remote):]]).in_
+
+        collections = {}
+        keys = list(keys)
+        for i in range(0, len(keys), _batch_size):
+            batch = keys[i:i + _batch_size]
+            if len(remote) == 1:
+                batch = [key[0] for key in batch]
+            rows = [getattr(row, '_mapping', row) for row in
+                    bind.execute(statement.where(criterion(batch)))]
+            dicts = [self._dictify(row) for row in rows]
+            self._load_collections(dicts, rows, bind)
+            for dict_, row in zip(dicts, rows):
+                key = tuple(row[label] for label in labels)
+                collections.setdefault(key, []).append(dict_)
+        return collections
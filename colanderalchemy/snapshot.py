@@ -0,0 +1,394 @@
+# snapshot.py
+# Copyright (C) 2012 the ColanderAlchemy authors and contributors
+# <see AUTHORS file>
+#
+# This module is part of ColanderAlchemy and is released under
+# the MIT License: http://www.opensource.org/licenses/mit-license.php
+
+import hashlib
+import logging
+import operator
+import os
+import pickle
+import sys
+import tempfile
+
+import colander
+import sqlalchemy
+from sqlalchemy import inspect
+from sqlalchemy.orm import (ColumnProperty, RelationshipProperty)
+from sqlalchemy.schema import (ColumnDefault, FetchedValue)
+from sqlalchemy.types import TypeEngine
+
+from . import _LazySchema
+from .schema import SQLAlchemySchemaNode
+
+
+__all__ = ['fingerprint', 'load_snapshot', 'save_snapshot',
+           'setup_schema_snapshot']
+
+log = logging.getLogger(__name__)
+
+__colanderalchemy__ = '__colanderalchemy__'
+
+# Bump whenever the layout of snapshot files changes.
+SNAPSHOT_FORMAT = 2
+
+_simple_types = (type(None), bool, int, float, str, bytes)
+
+# Versions and sources do not change while the process runs.
+_environment = None
+_module_digests = {}
+
+
+_key = operator.attrgetter('key')
+
+
+def _path(obj):
+    return '%s.%s' % (obj.__module__,
+                      getattr(obj, '__qualname__', obj.__name__))
+
+
+def _stable_repr(obj, depth=0):
+    """ Return a representation of ``obj`` that does not vary between
+    processes, unlike the default ``repr`` of most objects which contains
+    their memory address.
+    """
+    if depth > 8:
+        return '...'
+    depth += 1
+    if obj is None or isinstance(obj, (bool, int, float, str, bytes)):
+        return repr(obj)
+    elif isinstance(obj, dict):
+        items = sorted('%s: %s' % (_stable_repr(key, depth),
+                                   _stable_repr(value, depth))
+                       for key, value in obj.items())
+        return '{%s}' % ', '.join(items)
+    elif isinstance(obj, (list, tuple)):
+        return '[%s]' % ', '.join(_stable_repr(item, depth) for item in obj)
+    elif isinstance(obj, (set, frozenset)):
+        return '{%s}' % ', '.join(sorted(_stable_repr(item, depth)
+                                         for item in obj))
+    elif isinstance(obj, type) or callable(obj) and hasattr(obj, '__name__'):
+        return _path(obj)
+    elif hasattr(obj, '__dict__'):
+        return '%s(%s)' % (_path(obj.__class__),
+                           _stable_repr(vars(obj), depth))
+    return '%s(%s)' % (_path(obj.__class__), repr(obj))
+
+
+def _describe_value(value):
+    if isinstance(value, _simple_types):
+        return repr(value)
+    elif isinstance(value, TypeEngine):
+        return _describe_type(value)
+    elif (isinstance(value, (dict, list, tuple, set, frozenset, type)) or
+          callable(value)):
+        return _stable_repr(value)
+    return _path(value.__class__)
+
+
+def _describe_type(type_):
+    # The public attributes of a type are its constructor arguments, such
+    # as the length of a String or the values of an Enum, and are mostly
+    # simple values.  This is much cheaper than its repr, which inspects the
+    # signature of the constructor.  Private attributes are left out: they
+    # include caches filled as the type is used.
+    return '%s(%s)%s' % (
+        _path(type_.__class__),
+        ', '.join('%s=%s' % (key, _describe_value(value))
+                  for key, value in sorted(vars(type_).items())
+                  if not key.startswith('_')),
+        _describe_info(getattr(type_, SQLAlchemySchemaNode.ca_class_key,
+                               None)))
+
+
+def _describe_info(info):
+    return _stable_repr(info) if info else ''
+
+
+def _describe_column(column):
+    default = column.default
+    if isinstance(default, ColumnDefault) and default.is_scalar:
+        default = _stable_repr(default.arg)
+    elif default is not None:
+        default = _path(default.__class__)
+    return '%s %s %r %r %r %r %s %r %s' % (
+        column.name,
+        _describe_type(column.type),
+        column.nullable,
+        column.primary_key,
+        column.autoincrement,
+        getattr(column.table, '_autoincrement_column', None) is column,
+        default,
+        isinstance(column.server_default, FetchedValue),
+        _describe_info(column.info))
+
+
+def _describe_class(class_):
+    # Descriptions are strings rather than nested containers: strings are
+    # not tracked by the garbage collector, which would otherwise run many
+    # times while describing large registries.
+    mapper = inspect(class_)
+    lines = [_path(class_),
+             _describe_info(getattr(class_, SQLAlchemySchemaNode.ca_class_key,
+                                    None))]
+    for prop in sorted(mapper.attrs, key=_key):
+        lines.append('%s %s' % (prop.key, prop.__class__.__name__))
+        if isinstance(prop, ColumnProperty):
+            lines.extend(' %s' % _describe_column(column)
+                         for column in prop.columns
+                         if hasattr(column, 'nullable'))
+        elif isinstance(prop, RelationshipProperty):
+            lines.append(' %s %r %r %s' % (_path(prop.mapper.class_),
+                                           prop.uselist,
+                                           prop.innerjoin,
+                                           _describe_info(prop.info)))
+    return '\n'.join(lines)
+
+
+def _source_digest(filename):
+    """ Return a digest of the sources of the package of ``filename``.
+
+    This identifies the installed version of ColanderAlchemy and Colander,
+    including development versions, without looking up the distribution
+    metadata, which is much slower.
+    """
+    digest = hashlib.sha1()
+    directory = os.path.dirname(os.path.abspath(filename))
+    try:
+        for name in sorted(os.listdir(directory)):
+            if name.endswith('.py'):
+                with open(os.path.join(directory, name), 'rb') as source:
+                    digest.update(source.read())
+    except (IOError, OSError):
+        return 'unknown'
+    return digest.hexdigest()
+
+
+def _module_digest(name):
+    filename = getattr(sys.modules.get(name), '__file__', None)
+    if filename is None:
+        return None
+    digest = _module_digests.get(filename)
+    if digest is None:
+        try:
+            with open(filename, 'rb') as source:
+                digest = hashlib.sha1(source.read()).hexdigest()
+        except (IOError, OSError):
+            digest = 'unknown'
+        _module_digests[filename] = digest
+    return digest
+
+
+def _describe_environment(schema_class):
+    global _environment
+    if _environment is None:
+        _environment = (_source_digest(__file__),
+                        _source_digest(colander.__file__),
+                        sqlalchemy.__version__,
+                        sys.version)
+    registry = schema_class.type_registry
+    # The sources of schema_class and of the registered factories change
+    # the schemas built, without changing their name.
+    modules = set(class_.__module__ for class_ in schema_class.__mro__)
+    for factory in registry._factories.values():
+        modules.add(getattr(factory, '__module__', None) or
+                    factory.__class__.__module__)
+    return (SNAPSHOT_FORMAT,
+            _path(schema_class),
+            _environment,
+            sorted('%s: %s' % (_path(type_), _stable_repr(factory))
+                   for type_, factory in registry._factories.items()),
+            sorted((module, _module_digest(module)) for module in modules))
+
+
+def _mapped_classes(base):
+    classes = []
+    pending = [base]
+    while pending:
+        class_ = pending.pop()
+        pending.extend(class_.__subclasses__())
+        mapper = inspect(class_, raiseerr=False)
+        if mapper is not None and mapper.class_ is class_:
+            classes.append(class_)
+    return sorted(set(classes), key=_path)
+
+
+def fingerprint(classes, schema_class=SQLAlchemySchemaNode):
+    """ Return a fingerprint of the mapping configuration of ``classes``.
+
+    The fingerprint covers the columns, relationships and ColanderAlchemy
+    configuration of every class, the column types registered with
+    ``schema_class``, the sources of the modules defining ``schema_class``,
+    its base classes and the registered type factories, and the versions of
+    ColanderAlchemy, Colander, SQLAlchemy and Python.  Any change to those
+    yields a different fingerprint.
+    """
+    digest = hashlib.sha1(
+        repr(_describe_environment(schema_class)).encode('utf-8'))
+    for class_ in sorted(classes, key=_path):
+        digest.update(b'\n')
+        digest.update(_describe_class(class_).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _dumps(schemas):
+    # Each schema is pickled on its own, so that loading a snapshot only
+    # reads the file and schemas are unpickled when first used.  Schemas
+    # which cannot be pickled are left out and will be rebuilt.
+    pickles = {}
+    for path, schema in schemas.items():
+        try:
+            pickles[path] = pickle.dumps(schema, pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            log.debug('Schema for %s cannot be saved: %s', path, e)
+    return pickles
+
+
+def _load(path, classes, schema_class):
+    """ Return a dict mapping the classes found in the snapshot ``path``
+    to their pickled schema, or ``None`` if it cannot be used.
+    """
+    try:
+        with open(path, 'rb') as snapshot:
+            saved_fingerprint, pickles = pickle.load(snapshot)
+    except Exception as e:
+        log.debug('Snapshot %s cannot be read: %s', path, e)
+        return None
+    if saved_fingerprint != fingerprint(classes, schema_class):
+        log.debug('Snapshot %s is out of date', path)
+        return None
+    return dict((class_, pickles[_path(class_)]) for class_ in classes
+                if _path(class_) in pickles)
+
+
+class _SnapshotSchema(_LazySchema):
+    """ Descriptor unpickling the schema of ``class_`` on first access. """
+
+    def __init__(self, class_, data, schema_class):
+        super(_SnapshotSchema, self).__init__(class_)
+        self.data = data
+        self.schema_class = schema_class
+
+    def build(self):
+        try:
+            return pickle.loads(self.data)
+        except Exception as e:
+            log.debug('Schema for %s cannot be loaded: %s',
+                      _path(self.class_), e)
+            return self.schema_class(self.class_)
+        finally:
+            self.data = None
+
+
+def save_snapshot(path, classes, schema_class=SQLAlchemySchemaNode):
+    """ Save the schemas of ``classes`` to the file ``path``.
+
+    The schema of each class is its ``__colanderalchemy__`` attribute when
+    present, otherwise it is built with ``schema_class``.  Schemas are
+    pickled, so validators, types and other callables are stored by
+    reference; schemas that cannot be pickled (for instance because they
+    use a ``lambda`` validator) are left out and rebuilt when loading.
+
+    The file is replaced atomically.
+    """
+    classes = list(classes)
+    schemas = {}
+    for class_ in classes:
+        # Only consider schemas attached to the class itself, not inherited
+        # ones; lazy schemas are built by looking the attribute up.
+        schema = class_.__dict__.get(__colanderalchemy__)
+        if schema is not None and not isinstance(schema,
+                                                 SQLAlchemySchemaNode):
+            schema = getattr(class_, __colanderalchemy__)
+        if not isinstance(schema, SQLAlchemySchemaNode):
+            schema = schema_class(class_)
+        schemas[_path(class_)] = schema
+    data = pickle.dumps((fingerprint(classes, schema_class),
+                         _dumps(schemas)),
+                        pickle.HIGHEST_PROTOCOL)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.colanderalchemy-')
+    try:
+        with os.fdopen(fd, 'wb') as snapshot:
+            snapshot.write(data)
+        if hasattr(os, 'replace'):
+            os.replace(tmp, path)
+        else:
+            os.rename(tmp, path)
+    except Exception:
+        os.unlink(tmp)
+        raise
+
+
+def load_snapshot(path, classes, schema_class=SQLAlchemySchemaNode):
+    """ Load the schemas of ``classes`` from the file ``path``.
+
+    Returns a dict mapping each class found in the snapshot to its schema,
+    or ``None`` if the file does not exist, cannot be read or was saved for
+    a different configuration (see :func:`fingerprint`).
+
+    Snapshots are pickles: only load files written by your application.
+    """
+    pickles = _load(path, list(classes), schema_class)
+    if pickles is None:
+        return None
+    schemas = {}
+    for class_, data in pickles.items():
+        try:
+            schemas[class_] = pickle.loads(data)
+        except Exception as e:
+            log.debug('Schema for %s cannot be loaded: %s', _path(class_), e)
+    return schemas
+
+
+def setup_schema_snapshot(base, path, schema_class=SQLAlchemySchemaNode):
+    """ Attach a schema to every class mapped on ``base``, using a snapshot.
+
+    The schemas are loaded from the snapshot file ``path`` when it matches
+    the current configuration.  Otherwise, the schemas are built and the
+    snapshot is saved again.  Schemas which could not be saved in the
+    snapshot are always built.  The schemas are set as the
+    ``__colanderalchemy__`` attribute of each class, as done by
+    :func:`colanderalchemy.setup_schema`.  Returns ``True`` if every schema
+    was found in the snapshot.
+
+    Schemas found in the snapshot are only unpickled the first time the
+    attribute is accessed, like those attached by
+    :func:`colanderalchemy.setup_lazy_schema`;
+    :func:`colanderalchemy.warm_all` unpickles them all.
+
+    Use it together with :func:`colanderalchemy.setup_lazy_schema`, rather
+    than :func:`colanderalchemy.setup_schema`, so that schemas are not built
+    when mappers are configured.
+
+    Arguments/Keywords
+
+    base
+        A declarative base or mapped class; the schemas of this class and
+        all mapped subclasses are handled.
+    path
+        The path of the snapshot file.
+    schema_class
+        The class used to build missing schemas.
+        Default: :class:`colanderalchemy.SQLAlchemySchemaNode`.
+    """
+    classes = _mapped_classes(base)
+    pickles = _load(path, classes, schema_class)
+    loaded = pickles is not None
+    pickles = pickles or {}
+    for class_ in classes:
+        data = pickles.get(class_)
+        if data is None:
+            schema = schema_class(class_)
+        else:
+            schema = _SnapshotSchema(class_, data, schema_class)
+        setattr(class_, __colanderalchemy__, schema)
+    if not loaded:
+        try:
+            save_snapshot(path, classes, schema_class)
+        except (IOError, OSError) as e:
+            log.warning('Snapshot %s cannot be saved: %s', path, e)
+    return len(pickles) == len(classes)
@@ -59,7 +59,7 @@ setup(name='ColanderAlchemy',
       author_email='s.fontanelli@asidev.com',
       url='https://github.com/stefanofontanelli/ColanderAlchemy',
       license='MIT',
-      packages=find_packages(exclude=['tests']),
+      packages=find_packages(exclude=['tests', 'benchmarks', 'benchmarks.*']),
       include_package_data=True,
       zip_safe=True,
       install_requires=install_requires,
@@ -5,6 +5,17 @@
 # This module is part of ColanderAlchemy and is released under
 # the MIT License: http://www.opensource.org/licenses/mit-license.php
 
+import sys
+
+import tests.test_cache as test_cache
+import tests.test_query as test_query
+import tests.test_registry as test_registry
 import tests.test_schema as test_schema
+import tests.test_snapshot as test_snapshot
+
+__all__ = ['test_cache', 'test_query', 'test_registry', 'test_schema',
+           'test_snapshot']
 
-__all__ = ['test_schema']
+if sys.version_info >= (3, 5):
+    import tests.test_aio as test_aio
+    __all__.append('test_aio')
@@ -0,0 +1,90 @@
+# aio_cases.py
+# Copyright (C) 2012 the ColanderAlchemy authors and contributors
+# <see AUTHORS file>
+#
+# This module is part of ColanderAlchemy and is released under
+# the MIT License: http://www.opensource.org/licenses/mit-license.php
+
+""" Coroutines run by tests.test_aio, kept apart as they require Python
+3.5 or later.
+"""
+
+import asyncio
+import datetime
+
+from sqlalchemy import select
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.ext.asyncio import (AsyncSession, create_async_engine)
+
+from colanderalchemy import SQLAlchemySchemaNode
+from colanderalchemy.aio import (async_dictify,
+                                 async_dictify_many,
+                                 async_objectify)
+from tests.models import (Account,
+                          Address,
+                          Base,
+                          Person)
+
+
+def run(test, case):
+    """ Run the coroutine ``test(case, session)`` with a populated
+    database.
+    """
+
+    async def run():
+        engine = create_async_engine('sqlite+aiosqlite://')
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        try:
+            async with AsyncSession(engine) as session:
+                for i in range(3):
+                    person = Person(id=i, name=u'Name %d' % i,
+                                    surname=u'Surname', gender='M')
+                    person.addresses = [
+                        Address(street=u'Street %d.%d' % (i, j),
+                                city=u'City')
+                        for j in range(i)]
+                    session.add(Account(email=u'%d@domain.tld' % i,
+                                        timeout=datetime.time(1, 0),
+                                        person=person))
+                await session.commit()
+            async with AsyncSession(engine) as session:
+                await test(case, session)
+        finally:
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+async def dictify(case, session):
+    schema = SQLAlchemySchemaNode(Account, excludes=['timeout'])
+    accounts = (await session.scalars(
+        select(Account).order_by(Account.email))).all()
+    with case.assertRaises(InvalidRequestError):
+        schema.dictify(accounts[2])
+    appstruct = await async_dictify(schema, accounts[2])
+    case.assertEqual(appstruct['person']['name'], u'Name 2')
+    case.assertEqual(len(appstruct['person']['addresses']), 2)
+
+    appstructs = await async_dictify_many(schema, accounts,
+                                          fields='email,person.name')
+    case.assertEqual([a['person']['name'] for a in appstructs],
+                     [u'Name 0', u'Name 1', u'Name 2'])
+    case.assertEqual(await async_dictify_many(schema, []), [])
+    transient = Account(email=u'new@domain.tld')
+    case.assertEqual((await async_dictify(schema, transient))['email'],
+                     u'new@domain.tld')
+
+
+async def objectify(case, session):
+    schema = SQLAlchemySchemaNode(Person, includes=['id', 'addresses'],
+                                  overrides={
+                                      'addresses': {
+                                          'includes': ['street']}})
+    person = await session.get(Person, 1)
+    address = {'street': u'New Street'}
+    result = await async_objectify(
+        schema, {'id': 1, 'addresses': [address]}, person)
+    case.assertIs(result, person)
+    case.assertEqual([a.street for a in person.addresses],
+                     [u'New Street'])
@@ -0,0 +1,33 @@
+# test_aio.py
+# Copyright (C) 2012 the ColanderAlchemy authors and contributors
+# <see AUTHORS file>
+#
+# This module is part of ColanderAlchemy and is released under
+# the MIT License: http://www.opensource.org/licenses/mit-license.php
+
+import sys
+
+if sys.version_info[0] == 2 and sys.version_info[1] < 7:
+    # In Python < 2.7 use unittest2.
+    import unittest2 as unittest
+else:
+    import unittest
+
+aio_cases = None
+if sys.version_info >= (3, 7):
+    try:
+        import aiosqlite  # noqa: F401
+        import tests.aio_cases as aio_cases
+    except ImportError:
+        pass
+
+
+@unittest.skipIf(aio_cases is None,
+                 'Python 3.7 or later and aiosqlite are required')
+class TestsAsync(unittest.TestCase):
+
+    def test_async_dictify(self):
+        aio_cases.run(aio_cases.dictify, self)
+
+    def test_async_objectify(self):
+        aio_cases.run(aio_cases.objectify, self)
@@ -0,0 +1,136 @@
+# test_cache.py
+# Copyright (C) 2012 the ColanderAlchemy authors and contributors
+# <see AUTHORS file>
+#
+# This module is part of ColanderAlchemy and is released under
+# the MIT License: http://www.opensource.org/licenses/mit-license.php
+
+import gc
+import sys
+import weakref
+
+from sqlalchemy import (Column,
+                        Integer,
+                        Unicode,
+                        event)
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import (Mapper, configure_mappers)
+import colander
+
+import colanderalchemy.cache
+from colanderalchemy import (SQLAlchemySchemaNode,
+                             SchemaCache,
+                             get_schema,
+                             schema_cache)
+from tests.models import (Account,
+                          Person)
+
+if sys.version_info[0] == 2 and sys.version_info[1] < 7:
+    # In Python < 2.7 use unittest2.
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+class TestsSchemaCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = SchemaCache(maxsize=2)
+
+    def test_hit_and_miss(self):
+        schema = self.cache.get(Account)
+        self.assertIsInstance(schema, SQLAlchemySchemaNode)
+        self.assertIs(self.cache.get(Account), schema)
+        self.assertEqual(self.cache.info(),
+                         dict(hits=1, misses=1, maxsize=2, currsize=1))
+
+    def test_configuration_is_part_of_the_key(self):
+        schema = self.cache.get(Account)
+        includes = self.cache.get(Account, includes=['email'])
+        self.assertIsNot(schema, includes)
+        self.assertEqual([node.name for node in includes], ['email'])
+        self.assertIs(self.cache.get(Account, includes=('email',)), includes)
+
+        overrides = {'email': {'typ': colander.Integer}}
+        schema = self.cache.get(Account, overrides=overrides)
+        same = self.cache.get(Account,
+                              overrides={'email': {'typ': colander.Integer}})
+        self.assertIs(schema, same)
+        self.assertIsNot(self.cache.get(Account, title='Account'), schema)
+
+    def test_unhashable_configuration(self):
+        class Unhashable(object):
+            __hash__ = None
+
+        first = self.cache.get(Account, dummy=Unhashable())
+        second = self.cache.get(Account, dummy=Unhashable())
+        self.assertIsNot(first, second)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_identity_compared_configuration(self):
+        overrides = {'email': {'typ': colander.String()}}
+        schema = self.cache.get(Account)
+        self.assertIsNot(self.cache.get(Account, overrides=overrides),
+                         self.cache.get(Account, overrides=overrides))
+        # The cached schema was not evicted.
+        self.assertEqual(len(self.cache), 1)
+        self.assertIs(self.cache.get(Account), schema)
+
+        overrides = {'email': {'typ': colander.String,
+                               'missing': colander.drop,
+                               'title': 'E-mail'}}
+        schema = self.cache.get(Account, overrides=overrides)
+        self.assertIs(self.cache.get(Account, overrides=overrides), schema)
+
+    def test_lru_eviction(self):
+        account = self.cache.get(Account)
+        person = self.cache.get(Person)
+        self.cache.get(Account)
+        self.cache.get(Account, includes=['email'])
+        self.assertEqual(len(self.cache), 2)
+        # Person was the least recently used schema.
+        self.assertIs(self.cache.get(Account), account)
+        self.assertIsNot(self.cache.get(Person), person)
+
+    def test_invalidation(self):
+        account = self.cache.get(Account)
+        self.cache.get(Person)
+        self.cache.invalidate(Account)
+        self.assertEqual(len(self.cache), 1)
+        self.assertIsNot(self.cache.get(Account), account)
+
+        self.cache.clear()
+        self.assertEqual(self.cache.info()['hits'], 0)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_invalidation_on_mapper_configuration(self):
+        self.cache.get(Account)
+        misses = self.cache.info()['misses']
+
+        Base = declarative_base()
+
+        class Model(Base):
+            __tablename__ = 'cached_models'
+            id = Column(Integer, primary_key=True)
+            name = Column(Unicode(32))
+
+        configure_mappers()
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self.cache.info()['misses'], misses)
+
+    def test_single_listener(self):
+        cache = SchemaCache()
+        self.assertIn(cache, colanderalchemy.cache._caches)
+        ref = weakref.ref(cache)
+        del cache
+        gc.collect()
+        self.assertIsNone(ref())
+        self.assertTrue(event.contains(
+            Mapper, 'after_configured',
+            colanderalchemy.cache._invalidate_caches))
+
+    def test_get_schema(self):
+        schema = get_schema(Person, excludes=['addresses'])
+        self.assertIs(schema_cache.get(Person, excludes=['addresses']),
+                      schema)
+        self.assertNotIn('addresses', schema)
@@ -0,0 +1,338 @@
+# test_query.py
+# Copyright (C) 2012 the ColanderAlchemy authors and contributors
+# <see AUTHORS file>
+#
+# This module is part of ColanderAlchemy and is released under
+# the MIT License: http://www.opensource.org/licenses/mit-license.php
+
+import datetime
+import sys
+
+import colander
+from sqlalchemy import (create_engine, event)
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.orm import sessionmaker
+
+from colanderalchemy import SQLAlchemySchemaNode
+from tests.models import (Account,
+                          Address,
+                          Base,
+                          Group,
+                          Person)
+
+if sys.version_info[0] == 2 and sys.version_info[1] < 7:
+    # In Python < 2.7 use unittest2.
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+class TestsQuery(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        for i in range(5):
+            person = Person(id=i, name=u'Name %d' % i, surname=u'Surname',
+                            gender='M', age=20 + i)
+            person.addresses = [Address(street=u'Street %d.%d' % (i, j),
+                                        city=u'City')
+                                for j in range(i)]
+            self.session.add(Account(email=u'%d@domain.tld' % i,
+                                     enabled=True,
+                                     created=datetime.datetime(2020, 1, 1),
+                                     timeout=datetime.time(1, 0),
+                                     person=person))
+        self.session.commit()
+        self.session.expunge_all()
+
+    def count_statements(self):
+        statements = []
+
+        def count(conn, cursor, statement, parameters, context, many):
+            statements.append(statement)
+
+        event.listen(self.engine, 'before_cursor_execute', count)
+        self.addCleanup(event.remove, self.engine, 'before_cursor_execute',
+                        count)
+        return statements
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+
+    def query(self):
+        return self.session.query(Account).order_by(Account.email)
+
+    def expected(self, schema):
+        appstructs = schema.dictify_many(self.query())
+        self.session.expunge_all()
+        return appstructs
+
+    def test_iter_dictify(self):
+        schema = SQLAlchemySchemaNode(Account)
+        expected = self.expected(schema)
+
+        appstructs = schema.iter_dictify(self.query(), chunk_size=2)
+        self.assertEqual(next(appstructs), expected[0])
+        # The first chunk was processed and expunged.
+        self.assertEqual(len(self.session.identity_map), 0)
+        self.assertEqual([expected[0]] + list(appstructs), expected)
+        self.assertEqual(len(self.session.identity_map), 0)
+
+        chunks = list(schema.iter_dictify(self.query(), chunk_size=2,
+                                          chunks=True))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+        self.assertEqual(sum(chunks, []), expected)
+
+    def test_iter_dictify_keeps_objects(self):
+        schema = SQLAlchemySchemaNode(Account)
+        expected = self.expected(schema)
+
+        accounts = self.query().all()
+        accounts[0].enabled = False
+        with self.session.no_autoflush:
+            appstructs = list(schema.iter_dictify(accounts, chunk_size=3))
+        self.assertFalse(appstructs[0]['enabled'])
+        self.assertEqual(appstructs[1:], expected[1:])
+        self.assertIn(accounts[0], self.session)
+        self.assertNotIn(accounts[1], self.session)
+
+        accounts = self.query().all()
+        list(schema.iter_dictify(accounts, expunge=False))
+        self.assertTrue(all(account in self.session
+                            for account in accounts))
+
+    def test_iter_dictify_result(self):
+        try:
+            from sqlalchemy import select
+            statement = select(Account).order_by(Account.email)
+        except Exception:
+            self.skipTest('requires SQLAlchemy >= 1.4')
+        schema = SQLAlchemySchemaNode(Account)
+        expected = self.expected(schema)
+
+        result = self.session.execute(
+            statement.execution_options(yield_per=2))
+        self.assertEqual(list(schema.iter_dictify(result, chunk_size=2)),
+                         expected)
+        self.assertEqual(len(self.session.identity_map), 0)
+
+    def test_get_loader_options(self):
+        schema = SQLAlchemySchemaNode(
+            Account, excludes=['enabled'],
+            overrides={'person': {'excludes': ['birthday']}})
+        expected = self.expected(schema)
+
+        statements = self.count_statements()
+        query = self.query().options(*schema.get_loader_options())
+        self.assertEqual(schema.dictify_many(query), expected)
+        # Accounts joined with people, then addresses.
+        self.assertEqual(len(statements), 2)
+        self.assertNotIn('enabled', statements[0])
+        self.assertNotIn('birthday', statements[0])
+        self.assertIn('person_id', statements[1])
+        self.session.expunge_all()
+
+        del statements[:]
+        options = schema.get_loader_options(collection_strategy='subquery',
+                                            scalar_strategy='select')
+        appstructs = schema.dictify_many(self.query().options(*options))
+        self.assertEqual(appstructs, expected)
+        # One query for each person and one for their addresses.
+        self.assertEqual(len(statements), 1 + 2 * len(expected))
+
+        self.assertRaises(ValueError, schema.get_loader_options,
+                          scalar_strategy='unknown')
+
+    def test_get_loader_options_excluded(self):
+        schema = SQLAlchemySchemaNode(Account, excludes=['person'])
+        options = schema.get_loader_options(exclude_strategy='raise')
+        account = self.query().options(*options).first()
+        self.assertEqual(schema.dictify(account)['email'], account.email)
+        self.assertRaises(InvalidRequestError, lambda: account.person)
+
+    def test_dictify_rows(self):
+        self.session.add(Account(email=u'none@domain.tld',
+                                 timeout=datetime.time(1, 0)))
+        self.session.commit()
+        schema = SQLAlchemySchemaNode(Account)
+        expected = self.expected(schema)
+
+        statements = self.count_statements()
+        statement = schema.get_select().order_by(Account.email)
+        appstructs = schema.dictify_rows(self.session.execute(statement),
+                                         self.session)
+        self.assertEqual(appstructs, expected)
+        self.assertEqual(appstructs[-1]['person'], colander.null)
+        # Accounts joined with people, then addresses.
+        self.assertEqual(len(statements), 2)
+        self.assertEqual(len(self.session.identity_map), 0)
+
+        statement = schema.get_select().where(Account.email == u'0@domain.tld')
+        with self.engine.connect() as connection:
+            appstructs = schema.dictify_rows(connection.execute(statement),
+                                             connection)
+        self.assertEqual(appstructs, expected[:1])
+
+        self.assertRaises(ValueError, schema.dictify_rows,
+                          self.session.execute(schema.get_select()))
+        schema = SQLAlchemySchemaNode(Account, excludes=['person'])
+        rows = self.session.execute(schema.get_select()).fetchall()
+        self.assertEqual(len(schema.dictify_rows(rows)), len(expected))
+
+    def test_dictify_rows_secondary(self):
+        group = Group(identifier=u'group')
+        group.members = self.session.query(Person).order_by(Person.id)[:3]
+        self.session.add(group)
+        self.session.commit()
+        schema = SQLAlchemySchemaNode(Group, includes=['identifier',
+                                                       'members'])
+        self.assertEqual(schema.dictify_rows(
+            self.session.execute(schema.get_select()), self.session),
+            [schema.dictify(self.session.query(Group).one())])
+
+    def test_bulk_insert(self):
+        schema = SQLAlchemySchemaNode(
+            Person, excludes=['birthday'],
+            overrides={'addresses': {
+                'includes': ['street', 'city'],
+                'overrides': {'city': {'exclude': False}}}})
+        appstructs = [dict(name=u'New %d' % i, surname=u'Surname',
+                           gender='F', age=colander.null,
+                           addresses=[dict(street=u'New Street %d.%d' % (i, j),
+                                           city=u'City')
+                                      for j in range(i)])
+                      for i in range(4)]
+        appstructs.append(dict(id=100, name=u'New 100', surname=u'Surname',
+                               gender='F',
+                               addresses=[dict(street=u'Street',
+                                               city=u'City')]))
+
+        statements = self.count_statements()
+        schema.bulk_insert(self.session, appstructs, batch_size=10)
+        # People without addresses with a single statement, other people
+        # one at a time to get their key, then every address at once.
+        self.assertEqual(len(statements), 1 + 3 + 1 + 1)
+        self.session.commit()
+
+        people = self.session.query(Person).filter(
+            Person.name.startswith(u'New')).order_by(Person.name).all()
+        self.assertEqual([person.name for person in people],
+                         [u'New %d' % i for i in (0, 1, 100, 2, 3)])
+        self.assertEqual(people[2].id, 100)
+        self.assertIsNone(people[0].age)
+        self.assertEqual(sorted(address.street
+                                for address in people[4].addresses),
+                         [u'New Street 3.0', u'New Street 3.1',
+                          u'New Street 3.2'])
+        self.assertEqual([address.street for address in people[2].addresses],
+                         [u'Street'])
+
+        with self.engine.begin() as connection:
+            schema.bulk_insert(connection, [dict(name=u'Other',
+                                                 surname=u'Surname',
+                                                 gender='M')])
+        self.assertEqual(self.session.query(Person).filter_by(
+            name=u'Other').count(), 1)
+
+        # Rows returned by an executemany may come in any order unless the
+        # dialect can sort them by parameters.
+        dialect = self.engine.dialect
+        dialect.insert_executemany_returning = True
+        try:
+            with self.engine.begin() as connection:
+                statements = self.count_statements()
+                schema.bulk_insert(connection, appstructs[1:3])
+        finally:
+            del dialect.insert_executemany_returning
+        self.assertEqual(len(statements), 2 + 1)
+
+        schema = SQLAlchemySchemaNode(Account)
+        self.assertRaises(NotImplementedError, schema.bulk_insert,
+                          self.session, [dict(email=u'new@domain.tld',
+                                              person=dict(name=u'Name'))])
+
+    def test_objectify_session(self):
+        schema = SQLAlchemySchemaNode(Account)
+        person = self.session.query(Person).get(1)
+        dicts = [dict(email=u'new%d@domain.tld' % i,
+                      person=dict(id=i, name=u'New %d' % i))
+                 for i in (1, 2, 99)]
+        dicts.append(dict(email=u'0@domain.tld', enabled=False))
+
+        statements = self.count_statements()
+        accounts = schema.objectify_many(dicts, self.session)
+        # People, then accounts, person 1 being in the identity map.
+        self.assertEqual(len(statements), 2)
+        self.assertIs(accounts[0].person, person)
+        self.assertEqual(person.name, u'New 1')
+        self.assertEqual(len(person.addresses), 1)
+        self.assertIs(accounts[1].person, self.session.query(Person).get(2))
+        self.assertEqual(accounts[1].person.surname, u'Surname')
+        self.assertNotIn(accounts[2].person, self.session)
+        self.assertIs(accounts[3], self.session.query(Account).get(
+            u'0@domain.tld'))
+        self.assertEqual(accounts[3].enabled, False)
+
+        addresses = self.session.query(Person).get(2).addresses
+        dict_ = dict(id=2, addresses=[dict(id=address.id, city=u'Town')
+                                      for address in addresses])
+        dict_['addresses'].append(dict(street=u'New Street', city=u'Town'))
+        person = SQLAlchemySchemaNode(Person).objectify(dict_,
+                                                        session=self.session)
+        self.assertIs(person, self.session.query(Person).get(2))
+        self.assertEqual(person.addresses[:2], addresses)
+        self.assertEqual([address.city for address in person.addresses],
+                         [u'Town'] * 3)
+
+        context = Person()
+        self.assertIs(SQLAlchemySchemaNode(Person).objectify(
+            dict(id=3), context, self.session), context)
+
+    def test_objectify_changes(self):
+        schema = SQLAlchemySchemaNode(Person, excludes=['birthday'])
+        person = self.session.query(Person).get(2)
+        dict_ = schema.dictify(person)
+
+        statements = self.count_statements()
+        self.assertEqual(schema.objectify_changes(dict_, person), set())
+        self.assertFalse(self.session.dirty)
+        self.session.flush()
+        self.assertEqual(statements, [])
+
+        dict_['name'] = u'Changed'
+        dict_['age'] = colander.null
+        dict_['addresses'][1]['city'] = u'Town'
+        changes = schema.objectify_changes(dict_, person)
+        self.assertEqual(changes, set(['name', 'age', 'addresses.1.city']))
+        self.assertEqual(person.name, u'Changed')
+        self.assertIsNone(person.age)
+        self.assertEqual(person.addresses[1].city, u'Town')
+        self.session.flush()
+        self.assertEqual(len(statements), 2)
+        self.assertTrue(statements[0].startswith('UPDATE people SET name'))
+
+        addresses = list(person.addresses)
+        dict_['addresses'].reverse()
+        dict_['addresses'].append(dict(street=u'New Street', city=u'Town'))
+        self.assertEqual(schema.objectify_changes(dict_, person),
+                         set(['addresses']))
+        self.assertEqual(person.addresses[:2], addresses[::-1])
+        self.assertEqual(person.addresses[2].street, u'New Street')
+
+        schema = SQLAlchemySchemaNode(Account)
+        account = self.session.query(Account).get(u'1@domain.tld')
+        self.assertEqual(schema.objectify_changes(
+            dict(person=dict(name=u'Renamed')), account),
+            set(['person.name']))
+        self.assertEqual(account.person.name, u'Renamed')
+        other = self.session.query(Person).get(3)
+        self.assertEqual(schema.objectify_changes(
+            dict(person=dict(id=3, name=u'Other')), account, self.session),
+            set(['person', 'person.name']))
+        self.assertIs(account.person, other)
+        self.assertEqual(schema.objectify_changes(
+            dict(person=colander.null), account), set(['person']))
+        self.assertIsNone(account.person)
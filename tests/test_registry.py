@@ -0,0 +1,103 @@
+# test_registry.py
+# Copyright (C) 2012 the ColanderAlchemy authors and contributors
+# <see AUTHORS file>
+#
+# This module is part of ColanderAlchemy and is released under
+# the MIT License: http://www.opensource.org/licenses/mit-license.php
+
+import sys
+
+from sqlalchemy import (BigInteger,
+                        Column,
+                        Integer,
+                        LargeBinary,
+                        SmallInteger,
+                        Unicode)
+from sqlalchemy.dialects.postgresql import (INET,
+                                            UUID)
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.types import TypeDecorator
+import colander
+
+from colanderalchemy import (SQLAlchemySchemaNode,
+                             TypeRegistry,
+                             register_type,
+                             type_registry)
+
+if sys.version_info[0] == 2 and sys.version_info[1] < 7:
+    # In Python < 2.7 use unittest2.
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+class Blob(TypeDecorator):
+    impl = LargeBinary
+
+
+class Name(TypeDecorator):
+    impl = Unicode(32)
+
+
+class TestsTypeRegistry(unittest.TestCase):
+
+    def test_lookup_walks_mro(self):
+        registry = TypeRegistry({Integer: colander.Integer})
+        factory = registry.lookup(BigInteger)
+        self.assertIs(factory, registry.lookup(Integer))
+        self.assertIsInstance(factory(None)['typ'], colander.Integer)
+        self.assertIsNone(registry.lookup(Unicode))
+
+        registry.register(BigInteger, colander.String)
+        self.assertIsNot(registry.lookup(BigInteger),
+                         registry.lookup(SmallInteger))
+        registry.unregister(BigInteger)
+        self.assertIs(registry.lookup(BigInteger),
+                      registry.lookup(SmallInteger))
+
+    def test_register_type(self):
+        Base = declarative_base()
+
+        class Host(Base):
+            __tablename__ = 'hosts'
+            id = Column(UUID, primary_key=True)
+            address = Column(INET)
+            name = Column(Name)
+            blob = Column(Blob)
+
+        self.assertRaises(NotImplementedError, SQLAlchemySchemaNode, Host)
+
+        register_type(UUID, colander.String)
+        register_type(INET, lambda column: dict(
+            typ=colander.String(),
+            validator=colander.Length(max=43)))
+        register_type(Blob, colander.String)
+        try:
+            schema = SQLAlchemySchemaNode(Host)
+        finally:
+            for type_ in (UUID, INET, Blob):
+                type_registry.unregister(type_)
+
+        self.assertIsInstance(schema['id'].typ, colander.String)
+        self.assertIsInstance(schema['address'].validator, colander.Length)
+        self.assertEqual(schema['address'].validator.max, 43)
+        self.assertIsInstance(schema['blob'].typ, colander.String)
+        # TypeDecorator without registration fall back to their impl.
+        self.assertIsInstance(schema['name'].typ, colander.String)
+        self.assertEqual(schema['name'].validator.max, 32)
+
+    def test_schema_registry(self):
+        Base = declarative_base()
+
+        class Model(Base):
+            __tablename__ = 'registry_models'
+            id = Column(Integer, primary_key=True)
+
+        class FloatSchemaNode(SQLAlchemySchemaNode):
+            type_registry = type_registry.copy()
+
+        FloatSchemaNode.type_registry.register(Integer, colander.Float)
+        self.assertIsInstance(FloatSchemaNode(Model)['id'].typ,
+                              colander.Float)
+        self.assertIsInstance(SQLAlchemySchemaNode(Model)['id'].typ,
+                              colander.Integer)
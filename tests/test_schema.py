@@ -32,7 +32,9 @@ from sqlalchemy.schema import DefaultClause
 from sqlalchemy.types import TypeDecorator
 import colander
 
-from colanderalchemy import SQLAlchemySchemaNode
+from colanderalchemy import (SQLAlchemySchemaNode,
+                             setup_lazy_schema,
+                             warm_all)
 from tests.models import (Account,
                           Person,
                           Address,
@@ -470,6 +472,297 @@ class TestsSQLAlchemySchemaNode(unittest.TestCase):
         self.assertEqual(sensor.institution_id, newobj.institution_id)
         self.assertEqual(sensor.sensor_label, newobj.sensor_label)
 
+    def test_dictify_none_values(self):
+        """ Test that None is converted without serializing every node
+        """
+        Base = declarative_base()
+
+        class Sparse(Base):
+            __tablename__ = 'sparse'
+            id = Column(Integer, primary_key=True)
+            count = Column(Integer, nullable=True)
+            label = Column(String, nullable=True)
+
+        calls = []
+
+        class CountingInteger(colander.Integer):
+
+            def serialize(self, node, appstruct):
+                calls.append(appstruct)
+                return super(CountingInteger, self).serialize(node, appstruct)
+
+        schema = SQLAlchemySchemaNode(
+            Sparse, overrides={'count': {'typ': CountingInteger()}})
+        appstructs = schema.dictify_many([Sparse(id=i) for i in range(10)])
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(appstructs[0]['label'], colander.null)
+        self.assertIn(appstructs[0]['count'], (None, colander.null))
+        self.assertEqual(appstructs[9]['id'], 9)
+
+    def test_dictify_memo(self):
+        """ Test dictifying objects related to the same object once
+        """
+        schema = SQLAlchemySchemaNode(Account)
+        person = Person(name='My Name', surname='My Surname', gender='M',
+                        addresses=[Address(street='My Street')])
+        accounts = [Account(email='%d@domain.tld' % i, person=person)
+                    for i in range(3)]
+
+        appstructs = schema.dictify_many(accounts, memo=True)
+        self.assertEqual(appstructs, schema.dictify_many(accounts))
+        self.assertIs(appstructs[0]['person'], appstructs[2]['person'])
+        self.assertIsNot(appstructs[0], appstructs[1])
+        self.assertIsNot(schema.dictify_many(accounts)[0]['person'],
+                         schema.dictify_many(accounts)[1]['person'])
+
+        # Objects are only shared within the same call.
+        appstruct = schema.dictify(accounts[0], memo=True)
+        self.assertEqual(appstruct, appstructs[0])
+        self.assertIsNot(appstruct['person'], appstructs[0]['person'])
+
+        # Transient objects of a generator are collected as soon as they
+        # are dictified, and their id is reused by the next ones.
+        schema = SQLAlchemySchemaNode(Address)
+        appstructs = schema.dictify_many(
+            (Address(id=i, street='x') for i in range(5)), memo=True)
+        self.assertEqual([appstruct['id'] for appstruct in appstructs],
+                         list(range(5)))
+
+    def test_dictify_fields(self):
+        """ Test selecting fields and limiting the depth in dictify
+        """
+        schema = SQLAlchemySchemaNode(Account)
+        person = Person(name='My Name', surname='My Surname', gender='M',
+                        addresses=[Address(street='My Street')])
+        account = Account(email='mailbox@domain.tld', enabled=True,
+                          person=person)
+
+        self.assertEqual(schema.dictify(account,
+                                        fields='email, person.name'),
+                         dict(email='mailbox@domain.tld',
+                              person=dict(name='My Name')))
+        appstruct = schema.dictify(account, fields=['person.addresses.street',
+                                                    'enabled', 'unknown'])
+        addresses = [dict(street='My Street')]
+        self.assertEqual(appstruct,
+                         dict(enabled=True, person=dict(addresses=addresses)))
+        appstruct = schema.dictify(account, fields='person,person.name')
+        self.assertEqual(appstruct,
+                         dict(person=schema.dictify(account)['person']))
+
+        appstruct = schema.dictify(account, max_depth=0)
+        self.assertNotIn('person', appstruct)
+        self.assertEqual(appstruct['email'], 'mailbox@domain.tld')
+        appstruct = schema.dictify(account, max_depth=1)
+        self.assertEqual(appstruct['person']['name'], 'My Name')
+        self.assertNotIn('addresses', appstruct['person'])
+        self.assertEqual(schema.dictify_many([account], fields='person',
+                                             max_depth=1),
+                         [dict(person=appstruct['person'])])
+
+        # Unselected relationships are never read.
+        class Unloaded(object):
+            email = 'mailbox@domain.tld'
+
+            @property
+            def person(self):
+                raise AssertionError('person was read')
+
+        self.assertEqual(schema.dictify(Unloaded(), fields='email'),
+                         dict(email='mailbox@domain.tld'))
+        self.assertEqual(schema.dictify(Unloaded(), max_depth=0),
+                         dict(email='mailbox@domain.tld'))
+
+    def test_dictify_plan(self):
+        """ Test that dictify follows changes to the schema nodes
+        """
+        schema = self._prep_schema()
+        person = Person(name='My Name', surname='My Surname', gender='M',
+                        addresses=[Address(street='My Street',
+                                           city='My City')])
+        account = Account(email='mailbox@domain.tld', enabled=True,
+                          person=person)
+
+        appstruct = schema.dictify(account)
+        self.assertNotIn('non_sql', appstruct)
+        self.assertEqual(appstruct['person']['addresses'],
+                         [dict(street='My Street', city='My City')])
+
+        del schema['enabled']
+        self.assertNotIn('enabled', schema.dictify(account))
+        schema.add(colander.SchemaNode(colander.Boolean(), name='enabled'))
+        self.assertTrue(schema.dictify(account)['enabled'])
+        # A renamed node dictifies the attribute of its new name.
+        schema['email'].name = 'person_id'
+        account.person_id = 7
+        appstruct = schema.dictify(account)
+        self.assertNotIn('email', appstruct)
+        self.assertEqual(appstruct['person_id'], 7)
+        # Renaming nodes of related objects is found as well, without
+        # checking the names again for each related object.
+        addresses = schema['person']['addresses'].children[0]
+        city = addresses['city']
+        city.name = 'person_id'
+        person.addresses[0].person_id = 7
+        self.assertEqual(schema.dictify(account)['person']['addresses'],
+                         [dict(street='My Street', person_id=7)])
+        self.assertEqual(
+            schema.to_cstruct(account)['person']['addresses'],
+            [dict(street='My Street', person_id='7')])
+        city.name = 'city'
+        self.assertEqual(
+            schema.dictify_many([account])[0]['person']['addresses'],
+            [dict(street='My Street', city='My City')])
+
+        cloned = schema.clone()
+        del cloned['person']
+        self.assertNotIn('person', cloned.dictify(account))
+        self.assertIn('person', schema.dictify(account))
+
+        # Relationships whose nodes were overridden cannot be dictified.
+        overrides = {'addresses': {'children': [
+            colander.SchemaNode(colander.String(), name='street')]}}
+        schema = SQLAlchemySchemaNode(Person, overrides=overrides)
+        self.assertNotIn('addresses', schema.dictify(person))
+
+    def test_dictify_many(self):
+        """ Test SQLAlchemySchemaNode.dictify_many(objs)
+        """
+        schema = self._prep_schema()
+        accounts = []
+        for i in range(3):
+            address = Address(street='Street %d' % i, city='City')
+            person = Person(name='Name %d' % i, surname='Surname',
+                            gender='F', addresses=[address])
+            accounts.append(Account(email='%d@domain.tld' % i,
+                                    enabled=bool(i % 2), person=person))
+
+        appstructs = schema.dictify_many(iter(accounts))
+        self.assertEqual(appstructs,
+                         [schema.dictify(account) for account in accounts])
+        self.assertEqual(appstructs[2]['person']['addresses'],
+                         [dict(street='Street 2', city='City')])
+        self.assertEqual(schema.dictify_many([]), [])
+
+    def test_dictify_columns(self):
+        """ Test SQLAlchemySchemaNode.dictify_columns(objs)
+        """
+        schema = self._prep_schema()
+        accounts = []
+        for i in range(3):
+            address = Address(street='Street %d' % i, city='City')
+            person = Person(name='Name %d' % i, surname='Surname',
+                            gender='F', addresses=[address])
+            accounts.append(Account(email='%d@domain.tld' % i,
+                                    enabled=bool(i % 2),
+                                    person=person if i else None))
+
+        columns = schema.dictify_columns(iter(accounts))
+        self.assertEqual(list(columns),
+                         ['email', 'enabled', 'created', 'timeout',
+                          'person.name', 'person.surname', 'person.gender',
+                          'person.addresses'])
+        appstructs = schema.dictify_many(accounts)
+        for name in ['email', 'enabled', 'created', 'timeout']:
+            self.assertEqual(columns[name],
+                             [appstruct[name] for appstruct in appstructs])
+        self.assertEqual(columns['person.name'][1:], ['Name 1', 'Name 2'])
+        self.assertEqual(columns['person.addresses'][1:],
+                         [[dict(street='Street 1', city='City')],
+                          [dict(street='Street 2', city='City')]])
+        self.assertIn(columns['person.name'][0], (None, colander.null))
+        self.assertIs(columns['person.addresses'][0], None)
+        self.assertEqual(schema.dictify_columns([], fields='email'),
+                         dict(email=[]))
+
+        columns = schema.dictify_columns(accounts, arrays=True,
+                                         fields='email,enabled,person.id')
+        self.assertEqual(list(columns['enabled']), [False, True, False])
+        self.assertNotIsInstance(columns['enabled'], list)
+        self.assertNotIn('person.id', columns)
+
+        schema = SQLAlchemySchemaNode(Person, includes=['id', 'name'])
+        people = [Person(id=1, name='A'), Person(name='B')]
+        self.assertIsInstance(
+            schema.dictify_columns(people, arrays=True)['id'], list)
+        self.assertEqual(
+            list(schema.dictify_columns(people[:1], arrays=True)['id']), [1])
+
+    def test_to_cstruct(self):
+        """ Test SQLAlchemySchemaNode.to_cstruct(obj)
+        """
+        schema = self._prep_schema()
+        accounts = []
+        for i in range(3):
+            addresses = [Address(street='Street %d' % j, city='City')
+                         for j in range(i)]
+            person = Person(name='Name %d' % i, surname='Surname',
+                            gender='F', addresses=addresses)
+            accounts.append(Account(email='%d@domain.tld' % i,
+                                    enabled=bool(i % 2), timeout=None,
+                                    created=datetime.datetime(2014, 1, i + 1),
+                                    person=person if i else None))
+
+        for account in accounts:
+            self.assertEqual(schema.to_cstruct(account),
+                             schema.serialize(schema.dictify(account)))
+        self.assertEqual(schema.to_cstruct_many(accounts),
+                         [schema.to_cstruct(account) for account in accounts])
+
+        full = SQLAlchemySchemaNode(Account)
+        self.assertEqual(full.to_cstruct(accounts[1]),
+                         full.serialize(full.dictify(accounts[1])))
+
+        accounts[2].created = 'invalid'
+        with self.assertRaises(colander.Invalid) as expected:
+            schema.serialize(schema.dictify(accounts[2]))
+        with self.assertRaises(colander.Invalid) as raised:
+            schema.to_cstruct(accounts[2])
+        self.assertEqual(raised.exception.asdict(),
+                         expected.exception.asdict())
+
+    def test_child_index(self):
+        """ Test looking up child nodes by name after changing them
+        """
+        schema = SQLAlchemySchemaNode(Account)
+        email = schema['email']
+        self.assertIs(schema.get('email'), email)
+        self.assertIsNone(schema.get('missing'))
+        self.assertRaises(KeyError, lambda: schema['missing'])
+
+        extra = colander.SchemaNode(colander.String(), name='extra')
+        schema.add(extra)
+        self.assertIs(schema['extra'], extra)
+        first = colander.SchemaNode(colander.String(), name='first')
+        schema.insert(0, first)
+        self.assertIs(schema['first'], first)
+        del schema['email']
+        self.assertNotIn('email', schema)
+        replaced = colander.SchemaNode(colander.String())
+        schema['extra'] = replaced
+        self.assertIs(schema['extra'], replaced)
+        schema.children.append(email)
+        self.assertIs(schema['email'], email)
+        first.name = 'renamed'
+        self.assertNotIn('first', schema)
+        self.assertIs(schema['renamed'], first)
+
+        # Renamed after a lookup through a fresh index.
+        other = SQLAlchemySchemaNode(Account)
+        email = other['email']
+        email.name = 'mail'
+        self.assertIs(other.get('mail'), email)
+        self.assertIs(other['mail'], email)
+        self.assertIsNone(other.get('email'))
+        self.assertIsNone(other.get('missing'))
+
+        cloned = schema.clone()
+        self.assertIsNot(cloned['extra'], replaced)
+        self.assertEqual(cloned['extra'].name, 'extra')
+        bound = schema.bind(request=None)
+        self.assertIs(bound['person'], bound.children[
+            [node.name for node in bound].index('person')])
+
     def test_objectify(self):
         """ Test converting a dictionary or data structure into objects.
         """
@@ -553,6 +846,32 @@ class TestsSQLAlchemySchemaNode(unittest.TestCase):
         self.assertEqual(objectified.email, 'mailbox@domain.tld')
         self.assertEqual(objectified.dummy_property, 'dummy')
 
+    def test_objectify_plan(self):
+        """ Test that objectify classifies the mapped properties once
+        """
+        schema = self._prep_schema()
+        dict_ = {'email': 'mailbox@domain.tld',
+                 'created': colander.null,
+                 'person_id': 1,
+                 'non_sql': 'ignored',
+                 'person': {'name': 'My Name',
+                            'addresses': [{'street': 'My Street'}]}}
+        account = schema.objectify(dict_)
+        self.assertEqual(schema._objectify_plan['person'], 'scalar')
+        self.assertEqual(schema._objectify_plan['person_id'], 'column')
+        self.assertNotIn('non_sql', schema._objectify_plan)
+        self.assertIsNone(account.created)
+        self.assertEqual(account.person_id, 1)
+        self.assertEqual(account.person.addresses[0].street, 'My Street')
+        self.assertFalse(hasattr(account, 'non_sql'))
+
+        plan = schema._objectify_plan
+        schema.objectify(dict_)
+        self.assertIs(schema._objectify_plan, plan)
+        # Relationships must be mapped by the schema.
+        schema = SQLAlchemySchemaNode(Account, excludes=['person'])
+        self.assertRaises(KeyError, schema.objectify, {'person': {}})
+
     def test_clone(self):
         schema = SQLAlchemySchemaNode(Account, dummy='dummy', dummy2='dummy2')
         cloned = schema.clone()
@@ -563,6 +882,47 @@ class TestsSQLAlchemySchemaNode(unittest.TestCase):
         self.assertEqual([node.name for node in schema.children],
                          [node.name for node in cloned.children])
 
+    def test_clone_does_not_rebuild(self):
+        built = []
+
+        class CountingSchemaNode(SQLAlchemySchemaNode):
+            def add_nodes(self, *args):
+                built.append(self.class_)
+                super(CountingSchemaNode, self).add_nodes(*args)
+
+        schema = CountingSchemaNode(Account)
+        del built[:]
+        cloned = schema.clone()
+        self.assertEqual(built, [])
+        self.assertIsInstance(cloned, CountingSchemaNode)
+        self.assertEqual(cloned.inspector, schema.inspector)
+        self.assertEqual(self._schema_names(cloned),
+                         self._schema_names(schema))
+        for node, cloned_node in zip(schema.children, cloned.children):
+            self.assertIsNot(node, cloned_node)
+        cloned['email'].title = 'Changed'
+        self.assertNotEqual(schema['email'].title, 'Changed')
+
+        bound = schema.bind(dummy='dummy')
+        self.assertEqual(built, [])
+        self.assertEqual(bound.bindings, {'dummy': 'dummy'})
+
+    def test_clone_lazy_and_reused(self):
+        schema = SQLAlchemySchemaNode(Account, lazy=True)
+        cloned = schema.clone()
+        self.assertIn('_lazy_nodes', cloned.__dict__)
+        self.assertIn('_lazy_nodes', schema.__dict__)
+        self.assertIsNot(cloned['person'], schema['person'])
+
+        first = SQLAlchemySchemaNode(Account, reuse_nodes=True)
+        second = SQLAlchemySchemaNode(Account, reuse_nodes=True)
+        cloned = second.clone()
+        self.assertIn('_node_source', cloned.__dict__)
+        self.assertIs(cloned['email'].typ, first['email'].typ)
+        self.assertIsNot(cloned['email'], second['email'])
+        cloned = second.clone()
+        self.assertIsNot(cloned['email'], second['email'])
+
     def test_schemanode_arguments(self):
         """ Test that any arguments to SchemaNode are accepted.
         """
@@ -1373,3 +1733,175 @@ class TestsSQLAlchemySchemaNode(unittest.TestCase):
         # Unpatched, creating a bar or baz schema node causes infinite recursion
         schema = SQLAlchemySchemaNode(Bar)
         schema = SQLAlchemySchemaNode(Baz)
+
+    def _schema_names(self, schema):
+        return [(node.name, self._schema_names(node)) for node in schema]
+
+    def test_lazy_relationships(self):
+        """Test that lazy schemas only build their nodes when needed
+        """
+        schema = SQLAlchemySchemaNode(Account, lazy=True)
+        self.assertIn('_lazy_nodes', schema.__dict__)
+        person = schema['person']
+        self.assertNotIn('_lazy_nodes', schema.__dict__)
+        self.assertIn('_lazy_nodes', person.__dict__)
+        self.assertTrue(person.lazy)
+        self.assertEqual(person.missing, [])
+
+        self.assertIn('name', person)
+        self.assertNotIn('_lazy_nodes', person.__dict__)
+        addresses = person['addresses'].children[0]
+        self.assertIn('_lazy_nodes', addresses.__dict__)
+
+        self.assertEqual(self._schema_names(SQLAlchemySchemaNode(Account)),
+                         self._schema_names(schema))
+
+    def test_lazy_relationships_behaviour(self):
+        """Test that lazy and eager schemas produce the same results
+        """
+        eager = self._prep_schema()
+
+        def lazy_schema():
+            schema = SQLAlchemySchemaNode(Account, includes=eager.includes,
+                                          overrides=eager.overrides,
+                                          lazy=True)
+            schema.add(eager['non_sql'])
+            return schema
+
+        address = Address(street='My Street', city='My City')
+        person = Person(name='My Name', surname='My Surname',
+                        gender='M', addresses=[address])
+        account = Account(email='mailbox@domain.tld',
+                          enabled=True,
+                          created=datetime.datetime.now(),
+                          timeout=datetime.time(hour=1, minute=0),
+                          person=person)
+
+        appstruct = lazy_schema().dictify(account)
+        self.assertEqual(appstruct, eager.dictify(account))
+        cstruct = lazy_schema().serialize(appstruct)
+        self.assertEqual(cstruct, eager.serialize(appstruct))
+        self.assertEqual(lazy_schema().deserialize(cstruct),
+                         eager.deserialize(cstruct))
+        objectified = SQLAlchemySchemaNode(Account, lazy=True).objectify(
+            appstruct)
+        self.assertEqual(objectified.person.addresses[0].street, 'My Street')
+
+    def test_lazy_configuration_errors(self):
+        """Test that lazy schemas raise configuration errors when built
+        """
+        schema = SQLAlchemySchemaNode(Account, includes=['email'],
+                                      excludes=['email'], lazy=True)
+        self.assertRaises(ValueError, lambda: schema.children)
+        self.assertRaises(AttributeError, lambda: schema.not_an_attribute)
+
+    def test_setup_lazy_schema(self):
+        """Test that lazily attached schemas are built on first access
+        """
+        Base = declarative_base()
+
+        class Parent(Base):
+            __tablename__ = 'lazy_parents'
+            id = Column(Integer, primary_key=True)
+
+        class Child(Parent):
+            __tablename__ = 'lazy_children'
+            id = Column(Integer, ForeignKey(Parent.id), primary_key=True)
+            name = Column(Unicode(32))
+
+        for cls in (Parent, Child):
+            sqlalchemy.event.listen(cls, 'mapper_configured',
+                                    setup_lazy_schema)
+        sqlalchemy.orm.configure_mappers()
+
+        descriptor = Parent.__dict__['__colanderalchemy__']
+        self.assertNotIsInstance(descriptor, SQLAlchemySchemaNode)
+        schema = Parent.__colanderalchemy__
+        self.assertIsInstance(schema, SQLAlchemySchemaNode)
+        self.assertIs(Parent.__dict__['__colanderalchemy__'], schema)
+        self.assertIs(Parent.__colanderalchemy__, schema)
+        self.assertNotIn('name', schema)
+
+        self.assertNotIsInstance(Child.__dict__['__colanderalchemy__'],
+                                 SQLAlchemySchemaNode)
+        self.assertEqual(warm_all(Base), 1)
+        self.assertIsInstance(Child.__dict__['__colanderalchemy__'],
+                              SQLAlchemySchemaNode)
+        self.assertIn('name', Child.__colanderalchemy__)
+        self.assertEqual(warm_all(Base), 0)
+
+    def test_reuse_nodes_relationships(self):
+        """Test that identical relationship schemas reuse their nodes
+        """
+        Base = declarative_base()
+
+        class User(Base):
+            __tablename__ = 'reused_users'
+            id = Column(Integer, primary_key=True)
+            name = Column(Unicode(32))
+
+        class Document(Base):
+            __tablename__ = 'reused_documents'
+            id = Column(Integer, primary_key=True)
+            created_by_id = Column(Integer, ForeignKey(User.id))
+            created_by = relationship(User)
+
+        class Comment(Base):
+            __tablename__ = 'reused_comments'
+            id = Column(Integer, primary_key=True)
+            created_by_id = Column(Integer, ForeignKey(User.id))
+            created_by = relationship(User)
+            document_id = Column(Integer, ForeignKey(Document.id))
+            document = relationship(Document, backref='comments')
+
+        documents = SQLAlchemySchemaNode(Document, reuse_nodes=True)
+        comments = SQLAlchemySchemaNode(Comment, reuse_nodes=True)
+        self.assertIsNot(documents['created_by'], comments['created_by'])
+        self.assertEqual(comments['created_by'].name, 'created_by')
+        # The nodes are built once, and copied.
+        self.assertIsNot(documents['created_by']['name'],
+                         comments['created_by']['name'])
+        self.assertIs(documents['created_by']['name'].typ,
+                      comments['created_by']['name'].typ)
+        # Document.comments is excluded when Comment is a parent.
+        self.assertIn('comments', documents)
+        self.assertNotIn('comments', comments['document'])
+
+        # Nodes of different configurations are not reused.
+        overrides = {'created_by': {'excludes': ['name']}}
+        other = SQLAlchemySchemaNode(Comment, reuse_nodes=True,
+                                     overrides=overrides)
+        self.assertNotIn('name', other['created_by'])
+
+        # Changing a schema does not change the others, nor the
+        # schemas built afterwards.
+        del comments['created_by']['name']
+        self.assertNotIn('name', comments['created_by'])
+        self.assertIn('name', documents['created_by'])
+        documents['created_by'].add(colander.SchemaNode(colander.String(),
+                                                        name='extra'))
+        documents['id'].title = 'Changed'
+        self.assertNotIn('extra', comments['created_by'])
+        comments = SQLAlchemySchemaNode(Comment, reuse_nodes=True)
+        self.assertIn('name', comments['created_by'])
+        self.assertNotIn('extra', comments['created_by'])
+        self.assertNotIn('extra', comments['document']['created_by'])
+        self.assertEqual(comments['document']['id'].title, 'Id')
+
+        account = SQLAlchemySchemaNode(Account, reuse_nodes=True)
+        del account['person']['name']
+        account['email'].title = 'X'
+        account = SQLAlchemySchemaNode(Account, reuse_nodes=True)
+        self.assertIn('name', account['person'])
+        self.assertNotEqual(account['email'].title, 'X')
+
+    def test_reuse_nodes_lazy_relationships(self):
+        """Test reusing nodes between lazy schemas
+        """
+        first = SQLAlchemySchemaNode(Account, lazy=True, reuse_nodes=True)
+        second = SQLAlchemySchemaNode(Account, lazy=True, reuse_nodes=True)
+        self.assertIn('_node_source', second.__dict__)
+        self.assertIsNot(second['person'], first['person'])
+        self.assertIs(second['email'].typ, first['email'].typ)
+        self.assertEqual(self._schema_names(first),
+                         self._schema_names(SQLAlchemySchemaNode(Account)))
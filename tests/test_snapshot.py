@@ -0,0 +1,202 @@
+# test_snapshot.py
+# Copyright (C) 2012 the ColanderAlchemy authors and contributors
+# <see AUTHORS file>
+#
+# This module is part of ColanderAlchemy and is released under
+# the MIT License: http://www.opensource.org/licenses/mit-license.php
+
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+
+from sqlalchemy import (Column,
+                        Enum,
+                        Integer,
+                        TypeDecorator,
+                        Unicode)
+from sqlalchemy.ext.declarative import declarative_base
+
+from colanderalchemy import (SQLAlchemySchemaNode,
+                             warm_all)
+from colanderalchemy import snapshot
+from colanderalchemy.snapshot import (_SnapshotSchema,
+                                      fingerprint,
+                                      load_snapshot,
+                                      save_snapshot,
+                                      setup_schema_snapshot)
+from tests.models import (Account,
+                          Address,
+                          Person,
+                          has_unique_addresses)
+
+if sys.version_info[0] == 2 and sys.version_info[1] < 7:
+    # In Python < 2.7 use unittest2.
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+SnapshotBase = declarative_base()
+
+
+class SnapshotSchemaNode(SQLAlchemySchemaNode):
+    pass
+
+
+class Title(TypeDecorator):
+    impl = Unicode
+    cache_ok = True
+
+
+class Book(SnapshotBase):
+    __tablename__ = 'snapshot_books'
+    id = Column(Integer, primary_key=True)
+    title = Column(Unicode(64), nullable=False)
+
+
+class Magazine(SnapshotBase):
+    __tablename__ = 'snapshot_magazines'
+    __colanderalchemy_config__ = {
+        'overrides': {'title': {'validator': lambda node, value: None}}
+    }
+    id = Column(Integer, primary_key=True)
+    title = Column(Unicode(64), nullable=False)
+
+
+class TestsSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'schemas.snapshot')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _names(self, schema):
+        return [(node.name, node.typ.__class__, self._names(node))
+                for node in schema]
+
+    def test_pickle_schema(self):
+        schema = SQLAlchemySchemaNode(Person)
+        unpickled = pickle.loads(pickle.dumps(schema))
+        self.assertEqual(self._names(unpickled), self._names(schema))
+        self.assertIs(unpickled.inspector, schema.inspector)
+        self.assertIs(unpickled['addresses'].validator, has_unique_addresses)
+
+        lazy = SQLAlchemySchemaNode(Person, lazy=True)
+        unpickled = pickle.loads(pickle.dumps(lazy))
+        self.assertIn('_lazy_nodes', unpickled.__dict__)
+        self.assertEqual(self._names(unpickled), self._names(schema))
+
+    def test_save_and_load(self):
+        classes = [Account, Person, Address]
+        save_snapshot(self.path, classes)
+        schemas = load_snapshot(self.path, classes)
+        self.assertEqual(set(schemas), set(classes))
+        for class_ in classes:
+            self.assertIsNot(schemas[class_], class_.__colanderalchemy__)
+            self.assertEqual(self._names(schemas[class_]),
+                             self._names(class_.__colanderalchemy__))
+
+        # Another configuration does not match the snapshot.
+        self.assertIsNone(load_snapshot(self.path, [Account, Person]))
+        self.assertIsNone(load_snapshot(self.path + '.missing', classes))
+
+    def test_fingerprint(self):
+        first = fingerprint([Book, Magazine])
+        self.assertEqual(first, fingerprint([Magazine, Book]))
+        self.assertNotEqual(first, fingerprint([Book]))
+
+        Base = declarative_base()
+
+        def make_book(length):
+            class Book(Base):
+                __tablename__ = 'fingerprint_books_%d' % length
+                id = Column(Integer, primary_key=True)
+                title = Column(Unicode(length), nullable=False)
+            return Book
+
+        self.assertNotEqual(fingerprint([make_book(32)]),
+                            fingerprint([make_book(64)]))
+
+        def make_status(values, length):
+            class Status(declarative_base()):
+                __tablename__ = 'fingerprint_status'
+                id = Column(Integer, primary_key=True)
+                state = Column(Enum(*values, name='state'))
+                title = Column(Title(length))
+            return Status
+
+        self.assertEqual(fingerprint([make_status(['a', 'b'], 32)]),
+                         fingerprint([make_status(['a', 'b'], 32)]))
+        self.assertNotEqual(fingerprint([make_status(['a', 'b'], 32)]),
+                            fingerprint([make_status(['a', 'c'], 32)]))
+        self.assertNotEqual(fingerprint([make_status(['a', 'b'], 32)]),
+                            fingerprint([make_status(['a', 'b'], 64)]))
+
+        def make_counter(autoincrement):
+            class Counter(declarative_base()):
+                __tablename__ = 'fingerprint_counters'
+                id = Column(Integer, primary_key=True,
+                            autoincrement=autoincrement)
+            return Counter
+
+        self.assertNotEqual(fingerprint([make_counter('auto')]),
+                            fingerprint([make_counter(False)]))
+
+        # Editing the module of the schema class changes the fingerprint.
+        first = fingerprint([Book], SnapshotSchemaNode)
+        self.assertNotEqual(first, fingerprint([Book]))
+        digests = snapshot._module_digests
+        filename = sys.modules[__name__].__file__
+        saved = digests[filename]
+        digests[filename] = 'edited'
+        try:
+            self.assertNotEqual(first,
+                                fingerprint([Book], SnapshotSchemaNode))
+        finally:
+            digests[filename] = saved
+
+    def test_setup_schema_snapshot(self):
+        self.assertFalse(setup_schema_snapshot(SnapshotBase, self.path))
+        self.assertTrue(os.path.exists(self.path))
+        self.assertIsInstance(Book.__colanderalchemy__, SQLAlchemySchemaNode)
+        book = Book.__colanderalchemy__
+
+        # Magazine uses a lambda validator, which cannot be pickled.
+        self.assertEqual(set(load_snapshot(self.path, [Book, Magazine])),
+                         set([Book]))
+        mtime = os.path.getmtime(self.path)
+        self.assertFalse(setup_schema_snapshot(SnapshotBase, self.path))
+        self.assertEqual(os.path.getmtime(self.path), mtime)
+        # Schemas found in the snapshot are unpickled on first use.
+        self.assertIsInstance(Book.__dict__['__colanderalchemy__'],
+                              _SnapshotSchema)
+        self.assertIsInstance(Magazine.__dict__['__colanderalchemy__'],
+                              SQLAlchemySchemaNode)
+        self.assertEqual(warm_all(SnapshotBase), 1)
+        self.assertIsInstance(Book.__dict__['__colanderalchemy__'],
+                              SQLAlchemySchemaNode)
+        self.assertIsNot(Book.__colanderalchemy__, book)
+        self.assertEqual(self._names(Book.__colanderalchemy__),
+                         self._names(book))
+        self.assertEqual(
+            Book.__colanderalchemy__.deserialize({'title': 'Title'}),
+            {'title': 'Title'})
+
+        with open(self.path, 'wb') as snapshot:
+            snapshot.write(b'corrupted')
+        self.assertFalse(setup_schema_snapshot(SnapshotBase, self.path))
+        self.assertEqual(set(load_snapshot(self.path, [Book, Magazine])),
+                         set([Book]))
+
+        del Magazine.__colanderalchemy_config__['overrides']
+        try:
+            self.assertFalse(setup_schema_snapshot(SnapshotBase, self.path))
+            self.assertTrue(setup_schema_snapshot(SnapshotBase, self.path))
+        finally:
+            Magazine.__colanderalchemy_config__['overrides'] = {
+                'title': {'validator': lambda node, value: None}
+            }